@@ -1,14 +1,32 @@
 import os.path
+import threading
+from collections import Counter
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
 
+from replay import REPLAY_MODE, GmailStandIn
+
 # Gmail read-only scope
 SCOPES = ['https://www.googleapis.com/auth/gmail.readonly']
 
-def get_gmail_service():
-    """Authenticate and return Gmail API service."""
+# Credential loads / token refreshes / service builds in this process
+SERVICE_STATS = Counter()
+
+# Credentials are shared; httplib2 is not thread-safe, so each
+# worker thread gets its own service object.
+_creds = None
+_creds_lock = threading.Lock()
+_thread_local = threading.local()
+
+
+def _save_credentials(creds):
+    with open('token.json', 'w') as token:
+        token.write(creds.to_json())
+
+
+def _load_credentials():
     creds = None
 
     # Check if token.json exists (stores user session)
@@ -19,6 +37,7 @@ def get_gmail_service():
     if not creds or not creds.valid:
         if creds and creds.expired and creds.refresh_token:
             creds.refresh(Request())
+            SERVICE_STATS["token_refreshes"] += 1
         else:
             flow = InstalledAppFlow.from_client_secrets_file(
                 'credentials.json', SCOPES
@@ -26,9 +45,53 @@ def get_gmail_service():
             creds = flow.run_local_server(port=8080)
 
         # Save credentials
-        with open('token.json', 'w') as token:
-            token.write(creds.to_json())
+        _save_credentials(creds)
+
+    SERVICE_STATS["credential_loads"] += 1
+    return creds
+
+
+def get_credentials():
+    """
+    Returns the process-wide credentials, loading them once and
+    refreshing them once (under a lock) when they expire.
+    """
+    global _creds
+
+    with _creds_lock:
+        if _creds is None:
+            _creds = _load_credentials()
+
+        elif not _creds.valid and _creds.refresh_token:
+            _creds.refresh(Request())
+            _save_credentials(_creds)
+            SERVICE_STATS["token_refreshes"] += 1
+
+        return _creds
+
+
+def get_gmail_service():
+    """Authenticate and return this thread's cached Gmail API service."""
+    # Offline: everything is served from recorded fixtures
+    if REPLAY_MODE == "replay":
+        service = getattr(_thread_local, "service", None)
+        if service is None:
+            service = GmailStandIn()
+            _thread_local.service = service
+            SERVICE_STATS["service_builds"] += 1
+        return service
+
+    creds = get_credentials()
+
+    service = getattr(_thread_local, "service", None)
+    if service is None:
+        # Build Gmail service
+        service = build('gmail', 'v1', credentials=creds)
+
+        if REPLAY_MODE == "record":
+            service = GmailStandIn(real_service=service)
+
+        _thread_local.service = service
+        SERVICE_STATS["service_builds"] += 1
 
-    # Build Gmail service
-    service = build('gmail', 'v1', credentials=creds)
-    return service
\ No newline at end of file
+    return service
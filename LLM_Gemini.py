@@ -1,35 +1,248 @@
+import hashlib
 import os
+import threading
+import time
+
 from google import genai
+from google.genai import types
 from dotenv import load_dotenv
 
+from llm_usage import estimate_tokens, record_call
+from replay import REPLAY_MODE, RecordedError, record_llm, record_llm_error, replay_llm
+
 load_dotenv()
 
 # Use ONLY one stable Gemini model
 MODEL_NAME = "models/gemini-2.5-flash"
 
-client = genai.Client(
-    api_key=os.getenv("GOOGLE_API_KEY")
+# Built on first use: importing this module (benchmarks, replay)
+# needs no key
+_client = None
+_client_lock = threading.Lock()
+
+
+def _get_client():
+    """The shared genai.Client; None when replaying recorded responses."""
+    global _client
+
+    if REPLAY_MODE == "replay":
+        return None
+
+    with _client_lock:
+        if _client is None:
+            _client = genai.Client(api_key=os.getenv("GOOGLE_API_KEY"))
+        return _client
+
+
+# =========================================================
+# ⚙️ STATIC INSTRUCTIONS AS SYSTEM / CACHED CONTEXT
+# The fixed analysis instructions go in as a system instruction,
+# ahead of the email, so Gemini's implicit prefix caching can
+# reuse them across calls. EMAIL_AGENT_LLM_EXPLICIT_CACHE=1
+# uploads them once as an explicit cached content instead
+# (billed storage, guaranteed discount); if the cache cannot be
+# created the plain system instruction is used.
+# =========================================================
+
+LLM_EXPLICIT_CACHE = os.getenv("EMAIL_AGENT_LLM_EXPLICIT_CACHE", "") == "1"
+LLM_EXPLICIT_CACHE_TTL_SECONDS = int(
+    os.getenv("EMAIL_AGENT_LLM_EXPLICIT_CACHE_TTL", "3600")
 )
 
+# sha256(instruction) → (cached content name or None, created at)
+_explicit_caches = {}
+# sha256(instruction) → token count
+_instruction_tokens = {}
+_context_lock = threading.Lock()
+
 
 class LLMQuotaExhausted(Exception):
+    """Daily quota used up: stop the run, resume tomorrow."""
     pass
 
 
-def call_llm(prompt: str) -> str:
+class LLMRateLimited(Exception):
+    """Per-minute limit (429): retry after a backoff."""
+    pass
+
+
+class LLMTransientError(Exception):
+    """5xx / timeout: retry after a backoff."""
+    pass
+
+
+TRANSIENT_STATUSES = {500, 502, 503, 504}
+
+
+def classify_llm_error(e: Exception) -> Exception | None:
+    """
+    Maps a Gemini SDK error to LLMQuotaExhausted (per-day quota),
+    LLMRateLimited (per-minute 429) or LLMTransientError; None
+    for anything else.
+    """
+    msg = str(e).lower()
+    code = getattr(e, "code", None)
+
+    if (
+        code == 429
+        or "resource_exhausted" in msg
+        or "quota" in msg
+        or "rate limit" in msg
+    ):
+        # Quota ids look like "GenerateRequestsPerDayPerProjectPerModel"
+        if "perday" in msg or "per day" in msg or "daily" in msg:
+            return LLMQuotaExhausted(
+                "Gemini free tier quota exhausted. Resume tomorrow."
+            )
+        return LLMRateLimited(str(e))
+
+    if code in TRANSIENT_STATUSES or any(
+        word in msg for word in ("unavailable", "overloaded", "deadline", "timed out")
+    ):
+        return LLMTransientError(str(e))
+
+    return None
+
+
+def _digest(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def count_instruction_tokens(system_instruction: str) -> int:
+    """Tokens of a system instruction, counted once per run."""
+    key = _digest(system_instruction)
+
+    with _context_lock:
+        if key not in _instruction_tokens:
+            try:
+                _instruction_tokens[key] = _get_client().models.count_tokens(
+                    model=MODEL_NAME, contents=system_instruction
+                ).total_tokens
+            except Exception:
+                _instruction_tokens[key] = estimate_tokens(system_instruction)
+
+        return _instruction_tokens[key]
+
+
+def _explicit_cache_name(system_instruction: str) -> str | None:
+    key = _digest(system_instruction)
+
+    with _context_lock:
+        name, created_at = _explicit_caches.get(key, (None, None))
+
+        # Recreated a minute before it expires
+        if created_at is None or (
+            name is not None
+            and time.monotonic() - created_at > LLM_EXPLICIT_CACHE_TTL_SECONDS - 60
+        ):
+            try:
+                name = _get_client().caches.create(
+                    model=MODEL_NAME,
+                    config=types.CreateCachedContentConfig(
+                        system_instruction=system_instruction,
+                        ttl=f"{LLM_EXPLICIT_CACHE_TTL_SECONDS}s"
+                    )
+                ).name
+            except Exception as e:
+                print(f"⚠️ Explicit prompt cache unavailable → system instruction ({e})")
+                name = None
+
+            _explicit_caches[key] = (name, time.monotonic())
+
+        return name
+
+
+def _generation_config(system_instruction: str | None):
+    if system_instruction is None:
+        return None
+
+    if LLM_EXPLICIT_CACHE:
+        name = _explicit_cache_name(system_instruction)
+        if name is not None:
+            return types.GenerateContentConfig(cached_content=name)
+
+    return types.GenerateContentConfig(system_instruction=system_instruction)
+
+
+def _record_usage(response, prompt: str, system_instruction: str | None, latency_ms: float) -> None:
+    usage = getattr(response, "usage_metadata", None)
+    instruction_tokens = (
+        count_instruction_tokens(system_instruction) if system_instruction else 0
+    )
+
+    if usage is None or usage.prompt_token_count is None:
+        record_call(
+            input_tokens=instruction_tokens + estimate_tokens(prompt),
+            output_tokens=estimate_tokens(response.text or ""),
+            instruction_tokens=instruction_tokens,
+            latency_ms=latency_ms,
+            estimated=True
+        )
+        return
+
+    record_call(
+        input_tokens=usage.prompt_token_count,
+        output_tokens=usage.candidates_token_count or 0,
+        instruction_tokens=instruction_tokens,
+        cached_tokens=usage.cached_content_token_count or 0,
+        thinking_tokens=usage.thoughts_token_count or 0,
+        latency_ms=latency_ms
+    )
+
+
+def call_llm(prompt: str, system_instruction: str | None = None) -> str:
+    """
+    prompt is the per-email content; system_instruction the
+    static instructions shared by every call. Fixtures are keyed
+    by both joined, as they were sent before.
+    """
+    full_prompt = (
+        prompt if system_instruction is None
+        else system_instruction + "\n\n" + prompt
+    )
+
+    if REPLAY_MODE == "replay":
+        start = time.perf_counter()
+        try:
+            text = replay_llm(MODEL_NAME, full_prompt)
+        except RecordedError as e:
+            classified = classify_llm_error(e)
+            if classified is not None:
+                raise classified from e
+            raise
+        record_call(
+            input_tokens=estimate_tokens(full_prompt),
+            output_tokens=estimate_tokens(text),
+            instruction_tokens=(
+                estimate_tokens(system_instruction) if system_instruction else 0
+            ),
+            latency_ms=(time.perf_counter() - start) * 1000,
+            estimated=True
+        )
+        return text
+
     try:
-        response = client.models.generate_content(
+        start = time.perf_counter()
+        response = _get_client().models.generate_content(
             model=MODEL_NAME,
-            contents=prompt
+            contents=prompt,
+            config=_generation_config(system_instruction)
         )
+        latency_ms = (time.perf_counter() - start) * 1000
+
+        _record_usage(response, prompt, system_instruction, latency_ms)
+
+        if REPLAY_MODE == "record":
+            record_llm(MODEL_NAME, full_prompt, response.text)
+
         return response.text
 
     except Exception as e:
-        msg = str(e).lower()
+        if REPLAY_MODE == "record":
+            record_llm_error(MODEL_NAME, full_prompt, e)
 
-        if "quota" in msg or "limit" in msg:
-            raise LLMQuotaExhausted(
-                "Gemini free tier quota exhausted. Resume tomorrow."
-            )
+        classified = classify_llm_error(e)
+        if classified is not None:
+            raise classified from e
 
         raise
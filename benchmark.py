@@ -0,0 +1,1087 @@
+# benchmark.py
+#
+# Offline benchmarks (no Gmail account, no Gemini key).
+# Usage: python benchmark.py [name ...]   (no name → run all)
+
+import base64
+import glob
+import html
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+import tracemalloc
+from io import BytesIO
+
+import gmail_quota
+import ocr
+from gmail_fetch import fetch_metadata_batch, FETCH_STATS, METADATA_HEADERS
+from gmail_quota import QUOTA_STATS, execute_with_backoff
+from googleapiclient.errors import HttpError
+from html_backends import AVAILABLE, BACKENDS
+import email_analyser
+from llm_dispatcher import FakeLLM, LLMDispatcher
+from image_triage import triage_image_tag
+from inbox import (
+    STRONG_JOB_KEYWORDS,
+    MEDIUM_JOB_KEYWORDS,
+    compute_job_confidence,
+    score_many,
+    extract_email_content,
+    extract_plain_text,
+    extract_visible_html_text,
+    extract_image_urls,
+    normalize_text
+)
+from normalizer import JUNK_CHARS_REGEX
+from ocr import ocr_image_bytes, ocr_image_batch
+from llm_usage import CHARS_PER_TOKEN, estimate_tokens
+from prompt_assembler import PROMPT_TOKEN_BUDGET, assemble_prompt, render_sections
+from rate_limit import TokenBucket
+from replay import FIXTURES_DIR, FaultInjector, FixtureStore, GmailStandIn
+from thread_context import with_prior_state
+
+
+# =========================================================
+# 🧰 HELPERS
+# =========================================================
+
+def _report(name: str, seconds: float, count: int, extra: str = "") -> None:
+    per_1k = seconds / count * 1000 if count else 0.0
+    print(f"  {name:<28} {seconds:8.3f}s total | {per_1k:8.3f}s per 1k {extra}")
+
+
+def _newsletter_html(rows: int = 400) -> str:
+    cells = "".join(
+        f"<tr><td><table><tr><td><img src='https://cdn.example.com/{i}.png' "
+        f"width='120' height='40'></td><td><p>Senior Engineer role #{i} &amp; "
+        f"more&nbsp;details <a href='#'>Apply now</a></p></td></tr></table>"
+        f"</td></tr>"
+        for i in range(rows)
+    )
+    return (
+        "<html><head><style>td {padding: 0}</style></head><body>"
+        f"<table>{cells}</table><p>Unsubscribe · Privacy</p></body></html>"
+    )
+
+
+def _b64(text: str) -> str:
+    return base64.urlsafe_b64encode(text.encode("utf-8")).decode("ascii")
+
+
+def _newsletter_payload(rows: int = 400) -> dict:
+    html_content = _newsletter_html(rows)
+    return {
+        "mimeType": "multipart/alternative",
+        "parts": [
+            {"mimeType": "text/plain", "body": {"data": _b64("Plain body " * rows)}},
+            {"mimeType": "text/html", "body": {"data": _b64(html_content)}}
+        ]
+    }
+
+
+def _ats_html(rows: int = 60) -> str:
+    # Recruiter / ATS style: deeply nested layout tables
+    nested = "<p>Hi Candidate,</p><p>Your application moved to the next step.</p>"
+    for depth in range(rows):
+        nested = (
+            f"<table><tr><td class='c{depth}'>{nested}</td>"
+            f"<td><span>Step {depth}</span><br/>&copy; ATS</td></tr></table>"
+        )
+    return f"<!DOCTYPE html><html><head><title>Update</title></head><body>{nested}</body></html>"
+
+
+# Small documents for the parser corners backends disagree on
+EDGE_CASE_HTML = [
+    "<p>Hello<!-- hidden --> world</p>",
+    "<html><head><style>p{}</style><script>var a=1</script></head>"
+    "<body><p>Role: SDE</p><template>t</template></body></html>",
+    "<style>/*<![CDATA[*/ p{} /*]]>*/</style><p>a</p><noscript>enable js</noscript>",
+    "<p>R&amp;D &nbsp; &lt;team&gt; &#8377; 12 LPA &copy;</p>",
+    "<div><p>Location: Pune<p>CTC: 10 LPA<li>one<li>two</div>",
+    "<p>x<img alt=a><img src='https://a/b.png' width=1 height=1><img src=''></p>",
+    "Interview<br>on <b>Monday</b><span> 10am</span>",
+    "plain text only",
+    "<?xml version='1.0' encoding='utf-8'?><html><body><p>hi</p></body></html>",
+    "<html><head><title>Offer</title></head><body>Body</body></html>",
+]
+
+
+def _html_corpus() -> list[str]:
+    """
+    Synthetic newsletter / ATS mails, EDGE_CASE_HTML, plus the
+    HTML of every recorded format="full" message under
+    FIXTURES_DIR.
+    """
+    corpus = [_newsletter_html(), _ats_html(), *EDGE_CASE_HTML]
+
+    for path in glob.glob(os.path.join(FIXTURES_DIR, "gmail", "*.json")):
+        with open(path, encoding="utf-8") as f:
+            response = json.load(f).get("response")  # None for recorded errors
+
+        if isinstance(response, dict) and "payload" in response:
+            html_content = extract_email_content(response["payload"])["html_content"]
+            if html_content:
+                corpus.append(html_content)
+
+    return corpus
+
+
+def _time_loop(fn, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return time.perf_counter() - start
+
+
+def _disable_gmail_quota() -> None:
+    # Measure round-trip cost only, not the 250 units/s quota wait
+    gmail_quota.GMAIL_QUOTA = TokenBucket(rate=1e9, capacity=1e9)
+
+
+def _metadata_fixtures(count: int) -> tuple[FixtureStore, list[str]]:
+    store = FixtureStore(tempfile.mkdtemp(prefix="bench_fixtures_"))
+    ids = [f"msg{i:06d}" for i in range(count)]
+
+    for message_id in ids:
+        call = {
+            "method": "users.messages.get",
+            "kwargs": {
+                "userId": "me",
+                "id": message_id,
+                "format": "metadata",
+                "metadataHeaders": METADATA_HEADERS
+            }
+        }
+        store.save("gmail", call, {
+            "id": message_id,
+            "labelIds": ["INBOX", "IMPORTANT", "CATEGORY_UPDATES"],
+            "snippet": "Your interview is scheduled"
+        })
+
+    return store, ids
+
+
+# =========================================================
+# 📦 METADATA: SERIAL GET vs BATCH (user-001)
+# =========================================================
+
+def bench_metadata_fetch(count: int = 1000, latency_ms: float = 20) -> None:
+    print(f"\n📦 Metadata fetch — {count} messages, {latency_ms}ms per round trip")
+
+    store, ids = _metadata_fixtures(count)
+
+    service = GmailStandIn(store, latency_ms=latency_ms)
+    _disable_gmail_quota()
+
+    start = time.perf_counter()
+    for message_id in ids:
+        service.users().messages().get(
+            userId="me",
+            id=message_id,
+            format="metadata",
+            metadataHeaders=METADATA_HEADERS
+        ).execute()
+    _report("serial messages.get", time.perf_counter() - start, count,
+            f"| round trips={count}")
+
+    FETCH_STATS.clear()
+    start = time.perf_counter()
+    fetch_metadata_batch(service, ids)
+    _report("fetch_metadata_batch", time.perf_counter() - start, count,
+            f"| round trips={FETCH_STATS['metadata_round_trips']}")
+
+
+# =========================================================
+# 🚥 GMAIL THROTTLING: RETRY + BACKOFF + SLOWDOWN (user-006)
+# Error injection in the stand-in; exits non-zero on regression
+# =========================================================
+
+class _CountingBucket(TokenBucket):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.throttles = 0
+
+    def on_throttle(self) -> None:
+        self.throttles += 1
+        super().on_throttle()
+
+
+def bench_throttling(count: int = 120) -> None:
+    print(f"\n🚥 Gmail throttling — injected 429 / 403 / 5xx, {count} messages")
+
+    store, ids = _metadata_fixtures(count)
+    previous = gmail_quota.GMAIL_QUOTA, gmail_quota.BACKOFF_BASE_SECONDS
+    gmail_quota.BACKOFF_BASE_SECONDS = 0.001
+    problems = []
+
+    def check(name: str, ok: bool, detail: str = "") -> None:
+        print(f"  {'✅' if ok else '❌'} {name} {detail}")
+        if not ok:
+            problems.append(name)
+
+    def fresh(schedule) -> GmailStandIn:
+        gmail_quota.GMAIL_QUOTA = _CountingBucket(rate=1e6, capacity=1e6)
+        QUOTA_STATS.clear()
+        FETCH_STATS.clear()
+        return GmailStandIn(store, faults=FaultInjector(schedule=schedule))
+
+    def get(service, message_id: str):
+        return service.users().messages().get(
+            userId="me", id=message_id, format="metadata",
+            metadataHeaders=METADATA_HEADERS
+        )
+
+    try:
+        # Single call: 429 then 503, then served
+        service = fresh([429, 503])
+        result = execute_with_backoff(get(service, ids[0]), "messages.get")
+        check(
+            "single call retried",
+            result["id"] == ids[0] and QUOTA_STATS["retries"] == 2,
+            f"(retries={QUOTA_STATS['retries']})"
+        )
+        check(
+            "429 slows the bucket",
+            gmail_quota.GMAIL_QUOTA.throttles == 1
+            and gmail_quota.GMAIL_QUOTA.rate < gmail_quota.GMAIL_QUOTA.max_rate
+        )
+
+        # 404 is not retryable
+        service = fresh([404])
+        try:
+            execute_with_backoff(get(service, ids[0]), "messages.get")
+            check("404 raised", False)
+        except HttpError:
+            check("404 raised without retry", QUOTA_STATS["retries"] == 0)
+
+        # Persistent 429: gives up after MAX_RETRIES
+        service = fresh([429] * (gmail_quota.MAX_RETRIES + 1))
+        try:
+            execute_with_backoff(get(service, ids[0]), "messages.get")
+            check("retries bounded", False)
+        except HttpError:
+            check(
+                "retries bounded",
+                QUOTA_STATS["retries"] == gmail_quota.MAX_RETRIES,
+                f"(retries={QUOTA_STATS['retries']})"
+            )
+
+        # Batch: the POST fails with 503, then three calls inside
+        # the retried batch are throttled (429 / 403 / 429)
+        service = fresh([503, None, 429, 403, 429])
+        results = fetch_metadata_batch(service, ids)
+        check(
+            "batch POST retried, every message fetched",
+            len(results) == count,
+            f"({len(results)}/{count})"
+        )
+        check(
+            "throttled sub-calls retried",
+            FETCH_STATS["metadata_retries"] == 3
+            and FETCH_STATS["metadata_throttled"] == 3
+        )
+        check(
+            "throttled sub-calls slow the bucket",
+            gmail_quota.GMAIL_QUOTA.throttles >= 1,
+            f"(on_throttle calls={gmail_quota.GMAIL_QUOTA.throttles})"
+        )
+
+        # Random faults at 20%: nothing lost
+        gmail_quota.GMAIL_QUOTA = _CountingBucket(rate=1e6, capacity=1e6)
+        service = GmailStandIn(store, faults=FaultInjector(rate=0.2))
+        results = fetch_metadata_batch(service, ids)
+        check(
+            "20% random faults, every message fetched",
+            len(results) == count,
+            f"(injected={service.faults.injected})"
+        )
+
+    finally:
+        gmail_quota.GMAIL_QUOTA, gmail_quota.BACKOFF_BASE_SECONDS = previous
+
+    if problems:
+        sys.exit(1)
+
+
+# =========================================================
+# 🧾 EXTRACTION: TWO WALKS + TWO PARSES vs ONE (user-008)
+# =========================================================
+
+def bench_extraction(iterations: int = 20, rows: int = 400) -> None:
+    payload = _newsletter_payload(rows)
+    size_kb = len(_newsletter_html(rows)) // 1024
+    print(f"\n🧾 Extraction — {iterations} × {size_kb}KB newsletter HTML")
+
+    def separate():
+        extract_plain_text(payload)
+        html_content, _ = extract_visible_html_text(payload)
+        extract_image_urls(html_content)
+
+    _report("walk ×2 + parse ×2", _time_loop(separate, iterations), iterations)
+    _report(
+        "extract_email_content",
+        _time_loop(lambda: extract_email_content(payload), iterations),
+        iterations
+    )
+
+
+# =========================================================
+# 🧩 HTML BACKENDS: PARITY + THROUGHPUT (user-009)
+# =========================================================
+
+def bench_html_backends(iterations: int = 10) -> None:
+    corpus = _html_corpus()
+    total_mb = sum(len(html_content) for html_content in corpus) / 1e6
+    print(f"\n🧩 HTML backends — {len(corpus)} emails, {total_mb:.2f}MB")
+
+    reference = [BACKENDS["bs4"](html_content) for html_content in corpus]
+    failed = False
+
+    for name, parse in BACKENDS.items():
+        if not AVAILABLE[name]:
+            print(f"  {name:<12} not installed")
+            continue
+
+        mismatches = []
+        for index, (html_content, (ref_text, ref_images)) in enumerate(zip(corpus, reference)):
+            text, images = parse(html_content)
+            if normalize_text(text) != normalize_text(ref_text):
+                mismatches.append(f"email {index}: text differs")
+            elif [i["src"] for i in images] != [i["src"] for i in ref_images]:
+                mismatches.append(f"email {index}: image srcs differ")
+
+        seconds = _time_loop(
+            lambda: [parse(html_content) for html_content in corpus],
+            iterations
+        )
+        print(
+            f"  {name:<12} {total_mb * iterations / seconds:8.2f} MB/s | "
+            f"parity mismatches vs bs4: {len(mismatches)}/{len(corpus)}"
+        )
+        for mismatch in mismatches[:10]:
+            print(f"    ❌ {mismatch}")
+        failed = failed or bool(mismatches)
+
+    if failed:
+        sys.exit(1)
+
+
+# =========================================================
+# 🧹 NORMALIZER: CHAINED vs FUSED (user-010)
+# =========================================================
+
+def _chained_normalize_text(text: str) -> str:
+    # The pre-fusion implementation, kept as the golden reference
+    if not text:
+        return ""
+
+    text = html.unescape(text)
+    text = JUNK_CHARS_REGEX.sub(" ", text)
+    text = re.sub(r"\r\n", "\n", text)
+    text = re.sub(r"\n{2,}", "\n", text)
+    text = re.sub(r"[ \t]+", " ", text)
+
+    cleaned_lines = []
+    prev = None
+    for line in text.split("\n"):
+        line = line.strip()
+        if line and line != prev:
+            cleaned_lines.append(line)
+            prev = line
+
+    return "\n".join(cleaned_lines).strip()
+
+
+def _golden_bodies(count: int = 5000, size: int = 120_000) -> list[str]:
+    rng = random.Random(10)
+    pieces = [
+        "a", " ", "\t", "\n", "\r\n", "\xa0", "\u200b", "\ufeff",
+        "&amp;", "&nbsp;", "&#10;", "Interview", "  ", "\n\n\n",
+        "Your application for Backend Engineer was received. ",
+        "Unsubscribe | Privacy\n"
+    ]
+    bodies = [
+        "".join(rng.choice(pieces) for _ in range(rng.randint(0, 40)))
+        for _ in range(count)
+    ]
+
+    big = []
+    while sum(map(len, big)) < size:
+        big.append(rng.choice(pieces))
+    bodies.append("".join(big))
+    return bodies
+
+
+def _peak_mb(fn, *args) -> float:
+    tracemalloc.start()
+    fn(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak / 1e6
+
+
+def bench_normalizer(iterations: int = 20) -> None:
+    bodies = _golden_bodies()
+    large = bodies[-1]
+    print(f"\n🧹 normalize_text — {len(bodies)} golden bodies, {len(large) // 1024}KB large body")
+
+    mismatches = sum(
+        _chained_normalize_text(body) != normalize_text(body) for body in bodies
+    )
+    print(f"  byte mismatches vs chained implementation: {mismatches}")
+
+    for name, fn in (
+        ("chained (previous)", _chained_normalize_text),
+        ("fused", normalize_text)
+    ):
+        seconds = _time_loop(lambda: fn(large), iterations)
+        print(
+            f"  {name:<20} {seconds / iterations * 1000:8.2f}ms per body | "
+            f"peak alloc {_peak_mb(fn, large):6.2f}MB"
+        )
+
+
+# =========================================================
+# 🔠 TESSERACT: ONE PROCESS PER IMAGE vs BATCH (user-015)
+# =========================================================
+
+def _text_images(count: int) -> list[bytes]:
+    from PIL import Image, ImageDraw
+
+    images = []
+    for i in range(count):
+        img = Image.new("L", (640, 120), color=255)
+        draw = ImageDraw.Draw(img)
+        draw.text((10, 20), f"Interview scheduled #{i}", fill=0)
+        draw.text((10, 60), "Reply to confirm your slot", fill=0)
+
+        buffer = BytesIO()
+        img.save(buffer, format="PNG")
+        images.append(buffer.getvalue())
+
+    return images
+
+
+def bench_ocr_batch(count: int = 16) -> None:
+    images = _text_images(count)
+    print(f"\n🔠 Tesseract — {count} banner images (needs the tesseract binary)")
+
+    start = time.perf_counter()
+    per_image = [ocr_image_bytes(data) for data in images]
+    seconds = time.perf_counter() - start
+    print(f"  {'one call per image':<24} {seconds / count * 1000:8.1f}ms per image")
+
+    start = time.perf_counter()
+    batched = ocr_image_batch(images)
+    seconds = time.perf_counter() - start
+    print(f"  {'ocr_image_batch':<24} {seconds / count * 1000:8.1f}ms per image")
+
+    same = sum(a == b for a, b in zip(per_image, batched))
+    print(f"  identical text: {same}/{count}")
+
+
+# =========================================================
+# 🖼️ OCR PREPROCESSING: GRAYSCALE ONLY vs PIPELINE (user-016)
+# =========================================================
+
+def _preprocess_fixtures() -> list[tuple[str, bytes, str | None]]:
+    """
+    (name, image bytes, expected text) for a synthetic set —
+    oversized banner, tiny snippet, text on a dark background,
+    padded with wide borders, a photo-like gradient without text —
+    plus every image under FIXTURES_DIR/images (expected text in
+    an optional sidecar .txt file).
+    """
+    from PIL import Image, ImageDraw
+
+    def png(img):
+        buffer = BytesIO()
+        img.save(buffer, format="PNG")
+        return buffer.getvalue()
+
+    def text_image(size, text, xy, fg=0, bg=255, scale=1):
+        img = Image.new("L", size, color=bg)
+        ImageDraw.Draw(img).text(xy, text, fill=fg)
+        if scale != 1:
+            img = img.resize((size[0] * scale, size[1] * scale), Image.Resampling.NEAREST)
+        return img
+
+    expected = "Interview scheduled for Monday"
+    fixtures = [
+        ("huge banner", png(text_image((700, 200), expected, (20, 90), scale=6)), expected),
+        ("tiny snippet", png(text_image((200, 16), expected, (2, 2))), expected),
+        ("dark background", png(text_image((400, 60), expected, (10, 20), fg=255, bg=20)), expected),
+        ("wide borders", png(text_image((1600, 1200), expected, (700, 590))), expected),
+    ]
+
+    gradient = Image.linear_gradient("L").resize((800, 600))
+    fixtures.append(("gradient (no text)", png(gradient), ""))
+
+    for path in sorted(glob.glob(os.path.join(FIXTURES_DIR, "images", "*"))):
+        if path.endswith(".txt"):
+            continue
+        sidecar = os.path.splitext(path)[0] + ".txt"
+        text = None
+        if os.path.exists(sidecar):
+            with open(sidecar, encoding="utf-8") as f:
+                text = f.read()
+        with open(path, "rb") as f:
+            fixtures.append((os.path.basename(path), f.read(), text))
+
+    return fixtures
+
+
+def _word_recall(expected: str, text: str | None) -> float | None:
+    words = set(expected.lower().split())
+    if not words:
+        return None
+    found = set((text or "").lower().split())
+    return len(words & found) / len(words)
+
+
+def bench_preprocess(iterations: int = 3) -> None:
+    fixtures = _preprocess_fixtures()
+    print(f"\n🖼️ OCR preprocessing — {len(fixtures)} images (needs the tesseract binary)")
+
+    previous = ocr.OCR_PREPROCESS
+    try:
+        for label, enabled in (("grayscale only", False), ("preprocessed", True)):
+            ocr.OCR_PREPROCESS = enabled
+
+            start = time.perf_counter()
+            for _ in range(iterations):
+                texts = [ocr_image_bytes(data) for _, data, _ in fixtures]
+            seconds = time.perf_counter() - start
+
+            recalls = [
+                _word_recall(expected, text)
+                for (_, _, expected), text in zip(fixtures, texts)
+                if expected is not None
+            ]
+            recalls = [recall for recall in recalls if recall is not None]
+            mean_recall = sum(recalls) / len(recalls) if recalls else 0.0
+
+            print(
+                f"  {label:<16} {seconds / (iterations * len(fixtures)) * 1000:8.1f}ms per image | "
+                f"word recall {mean_recall:.0%}"
+            )
+            for (name, _, _), text in zip(fixtures, texts):
+                print(f"    {name:<22} {(text or '')[:50]!r}")
+    finally:
+        ocr.OCR_PREPROCESS = previous
+
+
+# =========================================================
+# ⭐ JOB CONFIDENCE: SUBSTRING SCAN vs COMPILED MATCHER (user-018)
+# =========================================================
+
+def _substring_confidence(text: str) -> float:
+    # The previous implementation (substring `in` per keyword)
+    if not text:
+        return 0.0
+
+    text = text.lower()
+    score = 0.0
+    for kw in STRONG_JOB_KEYWORDS:
+        if kw in text:
+            score += 0.35
+    for kw in MEDIUM_JOB_KEYWORDS:
+        if kw in text:
+            score += 0.15
+    return min(score, 1.0)
+
+
+def _snippets(count: int) -> list[str]:
+    rng = random.Random(18)
+    words = [
+        "your", "application", "for", "the", "latest", "update", "interview",
+        "scheduled", "newsletter", "sale", "contest", "offer", "letter",
+        "thank", "you", "role", "position", "weekly", "digest", "coding",
+        "assessment", "invoice", "receipt", "jobs", "unfortunately", "team"
+    ]
+    return [
+        " ".join(rng.choice(words) for _ in range(rng.randint(8, 30))).capitalize()
+        for _ in range(count)
+    ]
+
+
+# (text, expected score): recall the substring scan had must not
+# be lost to word matching; "latest" / "contest" must not match
+CONFIDENCE_CASES = [
+    ("test and tests", 0.35),
+    ("Your interview has been scheduled. Please confirm your availability", 0.65),
+    ("Jane accepted your invitation. You are now connected", 0.70),
+    ("Confirmed interview slot", 0.50),
+    ("Offer letters attached", 0.70),
+    ("See the next steps below", 0.15),
+    ("Read the latest contest results", 0.0),
+]
+
+
+def check_confidence_cases() -> list[str]:
+    """Mismatches between the two scorers and CONFIDENCE_CASES."""
+    texts = [text for text, _ in CONFIDENCE_CASES]
+    problems = []
+
+    for (text, expected), batch in zip(CONFIDENCE_CASES, score_many(texts)):
+        single = compute_job_confidence(text)
+        if abs(single - expected) > 1e-9 or abs(batch - expected) > 1e-9:
+            problems.append(
+                f"{text!r}: expected {expected}, "
+                f"compute_job_confidence {single}, score_many {batch}"
+            )
+
+    return problems
+
+
+def bench_confidence(count: int = 100_000) -> None:
+    snippets = _snippets(count)
+    print(f"\n⭐ Job confidence — {count} snippets")
+
+    timings = {}
+    for name, fn in (
+        ("substring scan (previous)", lambda: [_substring_confidence(t) for t in snippets]),
+        ("compute_job_confidence", lambda: [compute_job_confidence(t) for t in snippets]),
+        ("score_many", lambda: score_many(snippets)),
+    ):
+        start = time.perf_counter()
+        timings[name] = fn()
+        _report(name, time.perf_counter() - start, count)
+
+    changed = sum(
+        abs(old - new) > 1e-9
+        for old, new in zip(timings["substring scan (previous)"], timings["score_many"])
+    )
+    print(f"  scores changed by word boundaries: {changed}/{count}")
+
+    # Tier 1 (score_many) and tier 2 (compute_job_confidence)
+    # must agree on every text
+    disagree = sum(
+        abs(single - batch) > 1e-9
+        for single, batch in zip(timings["compute_job_confidence"], timings["score_many"])
+    )
+    problems = check_confidence_cases()
+    for problem in problems:
+        print(f"  ❌ {problem}")
+    print(
+        f"  single vs batch disagreements: {disagree}/{count} | "
+        f"regression cases failed: {len(problems)}/{len(CONFIDENCE_CASES)}"
+    )
+    if disagree or problems:
+        sys.exit(1)
+
+
+# =========================================================
+# 🚦 LLM DISPATCH: FIXED SLEEP vs PACED + CONCURRENT (user-023)
+# =========================================================
+
+def bench_llm_dispatch(count: int = 12, latency_ms: float = 800, rpm: float = 30) -> None:
+    print(
+        f"\n🚦 LLM dispatch — {count} prompts, fake backend with {rpm:.0f} RPM "
+        f"and {latency_ms:.0f}ms per call"
+    )
+    prompts = [f"EMAIL {i}\n" + "body " * 400 for i in range(count)]
+
+    # Previous behaviour: one call at a time, sleep(2) after each
+    fake = FakeLLM(rpm=rpm, tpm=1e9, latency_ms=latency_ms)
+    start = time.perf_counter()
+    errors = 0
+    for prompt in prompts:
+        try:
+            fake(prompt)
+        except Exception:
+            errors += 1
+        time.sleep(2)
+    print(
+        f"  {'serial + sleep(2)':<22} {time.perf_counter() - start:7.2f}s | "
+        f"429s={fake.stats['rejected_minute']} failed={errors}"
+    )
+
+    # Dispatcher: paced to the budget, 4 calls in flight
+    fake = FakeLLM(rpm=rpm, tpm=1e9, latency_ms=latency_ms)
+    dispatcher = LLMDispatcher(call=fake, rpm=rpm, tpm=1e9, max_in_flight=4)
+    start = time.perf_counter()
+    dispatcher.map(dispatcher.call, prompts)
+    print(
+        f"  {'dispatcher':<22} {time.perf_counter() - start:7.2f}s | "
+        f"429s={fake.stats['rejected_minute']} | {dispatcher.summary()}"
+    )
+
+
+# =========================================================
+# 📦 BATCH ANALYSIS: PACKING, SPLITTING, FALLBACK (user-022)
+# =========================================================
+
+BATCH_EMAIL_ID_REGEX = re.compile(r"^=== EMAIL (\S+) ===$", re.M)
+
+
+def _batch_entry(message_id: str, stage: str = "INTERVIEW") -> dict:
+    return {
+        "message_id": message_id,
+        "email_type": "JOB_PIPELINE",
+        "opportunities": [{"company": f"Company {message_id}", "pipeline_stage": stage}]
+    }
+
+
+def _fake_batch_reply(prompt: str, system_instruction: str | None) -> str:
+    """
+    Batch replies per first message ID: "a" drops a3 and gives a5
+    an unknown pipeline_stage, "b" is not a JSON array, any other
+    batch is answered in full. Single calls get a valid IGNORE.
+    """
+    if system_instruction != email_analyser.BATCH_SYSTEM_INSTRUCTION:
+        return '{"email_type": "IGNORE", "sender": "single", "subject": null}'
+
+    ids = BATCH_EMAIL_ID_REGEX.findall(prompt)
+    if ids[0].startswith("b"):
+        return '[{"message_id": "b0", "email_type": '
+    entries = [
+        _batch_entry(message_id, "PHONE_SCREEN" if message_id == "a5" else "INTERVIEW")
+        for message_id in ids if message_id != "a3"
+    ]
+    return "```json\n" + json.dumps(entries) + "\n```"
+
+
+def check_batch_packing() -> list[str]:
+    problems = []
+    small = [(f"s{i}", "Interview update " * 20) for i in range(19)]
+    near_budget = [
+        (f"t{i}", "x" * (email_analyser.BATCH_TOKEN_BUDGET * CHARS_PER_TOKEN // 3))
+        for i in range(5)
+    ]
+    oversized = [("big", "y" * (email_analyser.BATCH_TOKEN_BUDGET * CHARS_PER_TOKEN * 2))]
+    emails = small + near_budget + oversized + small[:2]
+
+    batches = email_analyser.pack_batches(emails)
+
+    if [item for batch in batches for item in batch] != emails:
+        problems.append("packing lost, duplicated or reordered emails")
+    for batch in batches:
+        tokens = sum(estimate_tokens(text) for _, text in batch)
+        if len(batch) > email_analyser.BATCH_MAX_EMAILS:
+            problems.append(f"batch of {len(batch)} emails")
+        if len(batch) > 1 and tokens > email_analyser.BATCH_TOKEN_BUDGET:
+            problems.append(f"batch of {tokens} tokens over the budget")
+    if [[message_id for message_id, _ in batch] for batch in batches if
+            any(message_id == "big" for message_id, _ in batch)] != [["big"]]:
+        problems.append("oversized email not packed alone")
+
+    sizes = [len(batch) for batch in batches]
+    print(f"  packing: {len(emails)} emails → batches of {sizes}")
+    return problems
+
+
+def bench_batch_analysis() -> None:
+    print("\n📦 Batch analysis — packing, per-message split, per-email fallback")
+    problems = check_batch_packing()
+
+    emails = (
+        [(f"a{i}", f"Email a{i}: your interview is scheduled") for i in range(8)]
+        + [(f"b{i}", f"Email b{i}: assessment link inside") for i in range(8)]
+        + [(f"c{i}", f"Email c{i}: application received") for i in range(8)]
+        + [("d0", "Email d0: offer letter attached")]
+    )
+    # Batches of 8: a*, b*, c*, then d0 alone (sent as a single call)
+    expected_fallback = {"a3", "a5"} | {f"b{i}" for i in range(8)}
+
+    fake = FakeLLM(rpm=1e9, tpm=1e12, response=_fake_batch_reply)
+    single_ids = []
+    stored = {}
+
+    def counting_reply(prompt, system_instruction):
+        if system_instruction != email_analyser.BATCH_SYSTEM_INSTRUCTION:
+            single_ids.append(re.search(r"Email (\S+):", prompt).group(1))
+        return _fake_batch_reply(prompt, system_instruction)
+
+    fake.response = counting_reply
+
+    previous = (
+        email_analyser.LLM_DISPATCHER,
+        email_analyser.get_cached_analysis,
+        email_analyser.store_analysis
+    )
+    # Fake backend, and an in-memory cache instead of .cache
+    email_analyser.LLM_DISPATCHER = LLMDispatcher(call=fake, rpm=1e9, tpm=1e12)
+    email_analyser.get_cached_analysis = lambda model, prompt: stored.get(prompt)
+    email_analyser.store_analysis = (
+        lambda model, prompt, raw_response, payload:
+        stored.__setitem__(prompt, {"raw_response": raw_response, "payload": payload})
+    )
+
+    try:
+        start = time.perf_counter()
+        results = email_analyser.analyze_emails(emails)
+        seconds = time.perf_counter() - start
+
+        # Second run: every email is served from the cache
+        calls_before = fake.stats["accepted"]
+        email_analyser.analyze_emails(emails)
+        cached_calls = fake.stats["accepted"] - calls_before
+
+    finally:
+        (
+            email_analyser.LLM_DISPATCHER,
+            email_analyser.get_cached_analysis,
+            email_analyser.store_analysis
+        ) = previous
+
+    fallback = set(single_ids) - {"d0"}
+    if fallback != expected_fallback:
+        problems.append(
+            f"fell back {sorted(fallback)}, expected {sorted(expected_fallback)}"
+        )
+    if single_ids.count("d0") != 1 or len(single_ids) != len(set(single_ids)):
+        problems.append(f"single calls {sorted(single_ids)}")
+    if set(results) != {message_id for message_id, _ in emails}:
+        problems.append(f"results for {sorted(results)}")
+
+    for message_id, _ in emails:
+        payload = results.get(message_id) or {}
+        from_batch = message_id not in expected_fallback and message_id != "d0"
+        if from_batch and payload.get("opportunities", [{}])[0].get("company") != f"Company {message_id}":
+            problems.append(f"{message_id}: batch entry not split back to its message")
+        if not from_batch and payload.get("sender") != "single":
+            problems.append(f"{message_id}: fallback payload not from a single call")
+        if "message_id" in payload:
+            problems.append(f"{message_id}: message_id left in the payload")
+
+    if cached_calls:
+        problems.append(f"{cached_calls} calls on a fully cached rerun")
+
+    batch_calls = fake.stats["accepted"] - len(single_ids)
+    print(
+        f"  {len(emails)} emails → {batch_calls} batch + {len(single_ids)} single calls "
+        f"in {seconds * 1000:.0f}ms | fell back: {sorted(fallback)}"
+    )
+
+    for problem in problems:
+        print(f"  ❌ {problem}")
+    if problems:
+        sys.exit(1)
+
+
+# =========================================================
+# ✂️ PROMPT BUDGET: WHOLE EMAIL vs ASSEMBLED PROMPT (user-025)
+# =========================================================
+
+# Modeled Gemini latency: fixed overhead + input tokens
+LLM_BASE_MS = 600
+LLM_MS_PER_1K_INPUT_TOKENS = 120
+
+
+# Prior thread state of a long thread, sent ahead of the email
+PRIOR_STATE = "\n".join(
+    f"- Company{n} | Backend Engineer | interview | deadline 2026-03-{n % 28 + 1:02d}"
+    for n in range(40)
+)
+
+
+def _prompt_corpus(count: int) -> list[tuple[list, list[str], list[str]]]:
+    """
+    (sections, fact lines, field lines) per email: half short job
+    mails, half the same content inside a newsletter (OCR
+    banners, filler, legal footer). Fields (location, CTC,
+    deadline, experience) carry no job keyword and sit apart
+    from the facts, among the filler.
+    """
+    rng = random.Random(25)
+    companies = ["Acme", "Globex", "Initech", "Umbrella", "Hooli", "Stark"]
+    roles = ["Backend Engineer", "Data Analyst", "SRE", "ML Engineer"]
+    cities = ["Pune", "Bengaluru", "Hyderabad", "Remote (India)"]
+    filler = [
+        "Top stories this week from around the community and our partners.",
+        "Read the latest product news, tips and tricks in our weekly digest.",
+        "Save 40% on annual plans this weekend only with code SPRING.",
+        "Our podcast is back with a new season on building great teams.",
+        "Join thousands of readers who get these highlights every Monday.",
+    ]
+    footer = [
+        "You are receiving this email because you signed up on our website.",
+        "Unsubscribe | Manage your email preferences | Privacy policy",
+        "© 2026 Example Media Inc. All rights reserved. 1 Market St, SF.",
+    ]
+
+    corpus = []
+    for i in range(count):
+        company, role = rng.choice(companies), rng.choice(roles)
+        facts = [
+            f"Your interview for the {role} position at {company} is scheduled for March {i % 28 + 1}.",
+            "Please complete the coding assessment before the interview and confirm your slot.",
+        ]
+        low = rng.randint(6, 30)
+        years = rng.randint(1, 8)
+        fields = [
+            f"Location: {rng.choice(cities)}",
+            f"CTC: {low}-{low + 6} LPA",
+            f"Apply by: {i % 28 + 1} April 2026",
+            f"Experience: {years}-{years + 3} years",
+        ]
+        header = f"Subject: {company} interview update\nDate: Mon, 2 Mar 2026 10:00:00 +0000"
+
+        if i % 2 == 0:
+            body = "\n".join(["Hi Sam,"] + facts + fields + ["Best,", f"{company} Recruiting"])
+            corpus.append(([("header", header), ("body", body)], facts, fields))
+            continue
+
+        ocr_text = "\n".join(
+            " ".join(rng.choice(["SALE", "NEW", "50%", "OFF", "SHOP", "NOW", "LIMITED"])
+                     for _ in range(12))
+            for _ in range(rng.randint(60, 200))
+        )
+        lines = [f"{rng.choice(filler)} ({n})" for n in range(rng.randint(150, 500))]
+        for field in fields:
+            position = rng.randint(len(lines) // 2, len(lines))
+            lines[position:position] = [field]
+        position = rng.randint(len(lines) // 4, len(lines) // 2)
+        lines[position:position] = facts
+        body = "\n".join(["Hi Sam,"] + lines + footer * 4)
+
+        corpus.append((
+            [("ocr", ocr_text), ("header", header), ("body", body)], facts, fields
+        ))
+
+    return corpus
+
+
+def bench_prompt_budget(count: int = 200) -> None:
+    corpus = _prompt_corpus(count)
+    print(f"\n✂️ Prompt budget — {count} emails, budget {PROMPT_TOKEN_BUDGET} tokens")
+
+    start = time.perf_counter()
+    assembled = [assemble_prompt(sections)[0] for sections, _, _ in corpus]
+    assembly_seconds = time.perf_counter() - start
+
+    # Replies: the prior state block shares the same budget
+    reserved = estimate_tokens(with_prior_state("", PRIOR_STATE))
+    with_state = [
+        with_prior_state(assemble_prompt(sections, reserved_tokens=reserved)[0], PRIOR_STATE)
+        for sections, _, _ in corpus
+    ]
+
+    problems = []
+    for name, prompts in (
+        ("whole email (previous)", [render_sections(sections) for sections, _, _ in corpus]),
+        ("assembled prompt", assembled),
+        ("with prior state", with_state),
+    ):
+        tokens = [estimate_tokens(prompt) for prompt in prompts]
+        facts_kept = sum(
+            all(fact in prompt for fact in facts)
+            for prompt, (_, facts, _) in zip(prompts, corpus)
+        )
+        fields_kept = sum(
+            all(field in prompt for field in fields)
+            for prompt, (_, _, fields) in zip(prompts, corpus)
+        )
+        confidence_kept = sum(
+            compute_job_confidence(prompt) >= compute_job_confidence(render_sections(sections))
+            for prompt, (sections, _, _) in zip(prompts, corpus)
+        )
+        latency = sum(
+            LLM_BASE_MS + LLM_MS_PER_1K_INPUT_TOKENS * t / 1000 for t in tokens
+        )
+        print(
+            f"  {name:<24} tokens={sum(tokens):>9} (max {max(tokens):>6}) | "
+            f"modeled LLM time {latency / 1000:7.1f}s | "
+            f"facts kept {facts_kept}/{count} | fields kept {fields_kept}/{count} | "
+            f"confidence kept {confidence_kept}/{count}"
+        )
+
+        if prompts is assembled or prompts is with_state:
+            if facts_kept < count or fields_kept < count:
+                problems.append(f"{name}: facts or fields dropped")
+            if max(tokens) > PROMPT_TOKEN_BUDGET:
+                problems.append(f"{name}: {max(tokens)} tokens over budget")
+
+    _report("assembly overhead", assembly_seconds, count)
+
+    for problem in problems:
+        print(f"  ❌ {problem}")
+    if problems:
+        sys.exit(1)
+
+
+# =========================================================
+# 🖼️ IMAGE TRIAGE: ICON / TRACKING URLS (user-013)
+# =========================================================
+
+# (src, skipped as icon_url): only the path decides, never the host
+ICON_URL_CASES = [
+    ("https://static.linkedin.com/media/job-offer.png", False),
+    ("https://pixel-cdn.net/banners/hiring.jpg", False),
+    ("https://cdn.socialhire.com/offer.png", False),
+    ("https://media.licdn.com/dms/image/offer-letter.jpg", False),
+    ("https://a.com/open-positions-banner.png", False),
+    ("https://a.com/img/x-ray.png", False),
+    ("https://a.com/open/jobs-banner.png", False),
+    ("https://a.com/careers/open/role.png", False),
+    ("https://a.com/open/senior-backend-engineer-role", False),
+    ("https://x.com/pixel.gif?u=1", True),
+    ("https://a.com/track/open.php?id=2", True),
+    ("https://a.com/wf/open?upn=1", True),
+    ("https://a.com/e/open.gif", True),
+    ("https://a.com/open/3f9a1c2e8b7d4a6f9e0c", True),
+    ("https://a.com/images/spacer.gif", True),
+    ("https://a.com/e/1x1.gif", True),
+    ("https://a.com/assets/icons/fb.png", True),
+    ("https://a.com/favicon.ico", True),
+    ("https://a.com/img/social/linkedin-icon-32.png", True),
+    ("https://a.com/img/facebook_logo.png", True),
+]
+
+
+def bench_icon_urls(count: int = 100_000) -> None:
+    print(f"\n🖼️ Icon URL triage — {len(ICON_URL_CASES)} cases, {count} srcs timed")
+
+    problems = [
+        f"{src}: expected {'icon_url' if expected else 'fetch'}"
+        for src, expected in ICON_URL_CASES
+        if (triage_image_tag({"src": src}) == "icon_url") != expected
+    ]
+
+    images = [{"src": ICON_URL_CASES[i % len(ICON_URL_CASES)][0]} for i in range(count)]
+    start = time.perf_counter()
+    for image in images:
+        triage_image_tag(image)
+    _report("triage_image_tag", time.perf_counter() - start, count)
+
+    for problem in problems:
+        print(f"  ❌ {problem}")
+    print(f"  cases failed: {len(problems)}/{len(ICON_URL_CASES)}")
+    if problems:
+        sys.exit(1)
+
+
+# =========================================================
+# 🚀 ENTRY POINT
+# =========================================================
+
+BENCHMARKS = {
+    "metadata": bench_metadata_fetch,
+    "throttling": bench_throttling,
+    "extraction": bench_extraction,
+    "html_backends": bench_html_backends,
+    "normalizer": bench_normalizer,
+    "ocr_batch": bench_ocr_batch,
+    "preprocess": bench_preprocess,
+    "confidence": bench_confidence,
+    "llm_dispatch": bench_llm_dispatch,
+    "batch_analysis": bench_batch_analysis,
+    "prompt_budget": bench_prompt_budget,
+    "icon_urls": bench_icon_urls,
+}
+
+
+def main():
+    names = sys.argv[1:] or list(BENCHMARKS)
+
+    for name in names:
+        BENCHMARKS[name]()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 from Connection import get_gmail_service
+from gmail_fetch import iter_with_metadata, iter_messages
 from inbox import compute_job_confidence
 
 
@@ -51,45 +52,21 @@ def main():
     query = f"in:inbox after:{START_DATE} before:{END_DATE}"
 
     # --------------------------------------------------
-    # 📩 PAGINATED FETCH
+    # 📩 STREAMING FETCH (pages processed as they arrive)
     # --------------------------------------------------
-    messages = []
-    page_token = None
-
-    while True:
-        resp = service.users().messages().list(
-            userId="me",
-            q=query,
-            maxResults=MAX_EMAILS,
-            pageToken=page_token
-        ).execute()
-
-        messages.extend(resp.get("messages", []))
-        page_token = resp.get("nextPageToken")
-
-        if not page_token:
-            break
-
-    print(f"📩 Total fetched: {len(messages)} emails\n")
+    messages = iter_messages(service, query, page_size=MAX_EMAILS)
 
     llm_count = 0
 
     # --------------------------------------------------
     # 🔁 PROCESS EACH EMAIL
     # --------------------------------------------------
-    for msg in messages:
+    # Fetch METADATA only (batched)
+    for msg, full in iter_with_metadata(
+        service, messages, ["From", "Subject"]
+    ):
         message_id = msg["id"]
 
-        # -------------------------------
-        # Fetch METADATA only
-        # -------------------------------
-        full = service.users().messages().get(
-            userId="me",
-            id=message_id,
-            format="metadata",
-            metadataHeaders=["From", "Subject"]
-        ).execute()
-
         headers = full.get("payload", {}).get("headers", [])
         subject = get_header(headers, "Subject")
         snippet = full.get("snippet", "")
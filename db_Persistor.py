@@ -6,7 +6,12 @@ from db_Repository import (
     insert_email,
     insert_or_update_opportunity,
     insert_opportunity_details,
-    insert_linkedin_event
+    insert_linkedin_event,
+    get_thread_opportunities,
+    get_labeled_emails,
+    ensure_sync_state_table,
+    get_sync_state,
+    set_sync_state
 )
 
 
@@ -22,6 +27,75 @@ def email_already_processed(cur, gmail_message_id: str) -> bool:
     return cur.fetchone() is not None
 
 
+def load_thread_state(gmail_message_ids: list[str]) -> list[dict]:
+    """
+    Opportunities already extracted from earlier messages of a
+    Gmail thread (empty for a new thread).
+    """
+    if not gmail_message_ids:
+        return []
+
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        return get_thread_opportunities(cur, gmail_message_ids)
+    finally:
+        cur.close()
+        conn.close()
+
+
+def load_labeled_emails(email_types: list[str]) -> list[tuple[str, str]]:
+    """
+    (raw_body_text, email_type) of every stored email whose type
+    the LLM assigned — the pre-classifier's training data.
+    """
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        return get_labeled_emails(cur, email_types)
+    finally:
+        cur.close()
+        conn.close()
+
+
+def load_sync_state(key: str) -> str | None:
+    """
+    Returns the stored value for a sync key (e.g. the last
+    Gmail historyId), or None on the first run.
+    """
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        ensure_sync_state_table(cur)
+        value = get_sync_state(cur, key)
+        conn.commit()
+        return value
+    finally:
+        cur.close()
+        conn.close()
+
+
+def save_sync_state(key: str, value: str) -> None:
+    save_sync_states({key: value})
+
+
+def save_sync_states(values: dict) -> None:
+    """Stores several sync keys in one transaction."""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        ensure_sync_state_table(cur)
+        for key, value in values.items():
+            set_sync_state(cur, key, value)
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        raise e
+    finally:
+        cur.close()
+        conn.close()
+
+
 def persist_email_payload(
     payload: dict,
     gmail_message_id: str,
@@ -290,3 +290,99 @@ def insert_linkedin_event(
         )
     )
     return cur.fetchone()[0]
+
+
+# =========================================================
+# 🧵 THREAD STATE (OPPORTUNITIES FROM EARLIER MESSAGES)
+# =========================================================
+
+def get_thread_opportunities(cur, gmail_message_ids: list[str]) -> list[dict]:
+    """
+    Current state of the opportunities first extracted from any
+    of the given Gmail messages.
+    """
+    if not gmail_message_ids:
+        return []
+
+    cur.execute(
+        """
+        SELECT
+            o.company,
+            o.role,
+            o.pipeline_stage,
+            o.action_required,
+            o.deadline,
+            o.event_date
+        FROM opportunities o
+        JOIN emails e ON e.id = o.email_id
+        WHERE e.gmail_message_id = ANY(%s)
+        ORDER BY o.last_updated_at;
+        """,
+        (list(gmail_message_ids),)
+    )
+
+    columns = [
+        "company",
+        "role",
+        "pipeline_stage",
+        "action_required",
+        "deadline",
+        "event_date"
+    ]
+    return [dict(zip(columns, row)) for row in cur.fetchall()]
+
+
+# =========================================================
+# 🏷️ LABELED EMAILS (PRE-CLASSIFIER TRAINING)
+# =========================================================
+
+def get_labeled_emails(cur, email_types: list[str]) -> list[tuple[str, str]]:
+    cur.execute(
+        """
+        SELECT raw_body_text, email_type
+        FROM emails
+        WHERE email_type = ANY(%s)
+          AND raw_body_text IS NOT NULL
+        ORDER BY id;
+        """,
+        (list(email_types),)
+    )
+    return cur.fetchall()
+
+
+# =========================================================
+# 🔖 SYNC STATE (INCREMENTAL GMAIL SYNC)
+# =========================================================
+
+def ensure_sync_state_table(cur) -> None:
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS sync_state (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL,
+            updated_at TIMESTAMP NOT NULL DEFAULT NOW()
+        );
+        """
+    )
+
+
+def get_sync_state(cur, key: str) -> str | None:
+    cur.execute(
+        "SELECT value FROM sync_state WHERE key = %s;",
+        (key,)
+    )
+    row = cur.fetchone()
+    return row[0] if row else None
+
+
+def set_sync_state(cur, key: str, value: str) -> None:
+    query = """
+        INSERT INTO sync_state (key, value, updated_at)
+        VALUES (%s, %s, NOW())
+        ON CONFLICT (key)
+        DO UPDATE SET
+            value = EXCLUDED.value,
+            updated_at = NOW();
+    """
+
+    cur.execute(query, (key, value))
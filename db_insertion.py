@@ -1,10 +1,41 @@
-import time
+from collections import Counter
 from datetime import datetime
-
-from Connection import get_gmail_service
-from inbox import get_clean_email_text,compute_job_confidence
-from email_analyser import analyze_email
-from db_Persistor import persist_email_payload, email_already_processed
+from itertools import chain
+
+from Connection import get_gmail_service, SERVICE_STATS
+from gmail_fetch import (
+    iter_metadata_chunks,
+    iter_messages_oldest_first,
+    fetch_full_messages,
+    fetch_thread_message_ids,
+    FETCH_STATS
+)
+from inbox import clean_email_from_message, compute_job_confidence, get_header, score_many
+from email_analyser import analyze_email, analyze_emails
+from message_cache import MESSAGE_CACHE
+from llm_cache import LLM_CACHE
+from llm_dispatcher import LLM_DISPATCHER
+from llm_usage import estimate_tokens, usage_summary
+from ocr import ocr_cache_summary
+from image_triage import triage_summary
+from gmail_sync import (
+    list_incremental_messages,
+    parse_retry_ids,
+    dump_retry_ids,
+    update_retry_ids,
+    HISTORY_STATE_KEY,
+    RETRY_STATE_KEY
+)
+from pre_classifier import should_skip_llm
+from prompt_assembler import assemble_prompt, describe_cuts, prompt_summary
+from thread_context import summarize_prior_state, thread_summary, with_prior_state, THREAD_STATS
+from db_Persistor import (
+    persist_email_payload,
+    email_already_processed,
+    load_thread_state,
+    load_sync_state,
+    save_sync_states
+)
 from db_Connection import get_db_connection
 
 
@@ -17,6 +48,38 @@ START_DATE = "2026/02/02"
 END_DATE   = "2026/02/05"   # includes entire February
 MAX_EMAILS = 500
 
+# "incremental" → Gmail history since the last stored historyId
+# "window"      → full START_DATE / END_DATE listing
+SYNC_MODE = "incremental"
+
+# Replies: send only the new turn (quotes / signature stripped)
+# plus the state earlier turns of the thread already produced
+THREAD_AWARE = True
+
+# --------------------------------------------------
+# ⭐ CONFIDENCE CASCADE
+# Tier 1 scores Subject + snippet from the metadata call, before
+# any full fetch / HTML parse / OCR:
+#   < SNIPPET_REJECT_BELOW  → rejected (no job keyword at all)
+#   > CONFIDENCE_THRESHOLD  → accepted, full-text gate skipped
+#   otherwise               → escalated to the full-text gate
+# --------------------------------------------------
+CONFIDENCE_THRESHOLD = 0.5
+SNIPPET_REJECT_BELOW = 0.15
+
+# One Gemini request for up to email_analyser.BATCH_MAX_EMAILS
+# emails (per-email fallback for entries that fail validation)
+ANALYSIS_BATCH_MODE = True
+
+# Tier 3: the local pre-classifier (python pre_classifier.py
+# train) answers confident IGNOREs without Gemini
+USE_PRE_CLASSIFIER = True
+
+# snippet_rejected / snippet_accepted / escalated /
+# thread_escalated / full_rejected / full_accepted /
+# classifier_skipped
+CASCADE_STATS = Counter()
+
 
 # =========================================================
 # 🔍 LLM-WORTHY FILTER (PRIMARY / IMPORTANT ONLY)
@@ -37,125 +100,415 @@ def is_llm_worthy(label_ids: list[str]) -> bool:
 
 
 # =========================================================
-# 🚀 AUTOMATED PIPELINE (GEMINI ENABLED)
+# 📩 DATE-WINDOW LISTING (SYNC_MODE = "window")
 # =========================================================
 
-def main():
-    service = get_gmail_service()
-    print("✅ Gmail service created\n")
+def list_window_messages(service):
+    """Streams the START_DATE / END_DATE window, oldest first."""
+    return iter_messages_oldest_first(
+        service, START_DATE, END_DATE, page_size=MAX_EMAILS
+    )
 
-    query = f"in:inbox after:{START_DATE} before:{END_DATE}"
 
-    # --------------------------------------------------
-    # 📩 PAGINATED GMAIL FETCH (CRITICAL)
-    # --------------------------------------------------
-    messages = []
-    page_token = None
+# =========================================================
+# ⭐ TIER 1: SUBJECT + SNIPPET (NO FULL FETCH)
+# =========================================================
 
-    while True:
-        resp = service.users().messages().list(
-            userId="me",
-            q=query,
-            maxResults=MAX_EMAILS,
-            pageToken=page_token
-        ).execute()
+def snippet_tiers(chunk) -> list[str]:
+    """
+    "reject", "accept" or "escalate" per (msg, metadata).
+
+    Under THREAD_AWARE a reply is never rejected here: its new
+    turn may have no keywords of its own, and whether its thread
+    is known is only checked after the fetch. It goes to the
+    full-text gate instead, which sees the quoted history unless
+    the thread has recorded state.
+    """
+    scores = score_many(
+        get_header(metadata.get("payload", {}).get("headers", []), "Subject")
+        + "\n" + metadata.get("snippet", "")
+        for _, metadata in chunk
+    )
+
+    tiers = []
+    for (msg, metadata), score in zip(chunk, scores):
+        thread_id = metadata.get("threadId")
+        is_reply = THREAD_AWARE and thread_id and thread_id != msg["id"]
+
+        if score < SNIPPET_REJECT_BELOW and is_reply:
+            CASCADE_STATS["thread_escalated"] += 1
+            tiers.append("escalate")
+        elif score < SNIPPET_REJECT_BELOW:
+            CASCADE_STATS["snippet_rejected"] += 1
+            tiers.append("reject")
+        elif score > CONFIDENCE_THRESHOLD:
+            CASCADE_STATS["snippet_accepted"] += 1
+            tiers.append("accept")
+        else:
+            CASCADE_STATS["escalated"] += 1
+            tiers.append("escalate")
+
+    return tiers
+
+
+def cascade_summary() -> str:
+    return " ".join(
+        f"{tier}={CASCADE_STATS[tier]}"
+        for tier in (
+            "snippet_rejected",
+            "snippet_accepted",
+            "escalated",
+            "thread_escalated",
+            "full_rejected",
+            "full_accepted",
+            "classifier_skipped"
+        )
+    )
 
-        messages.extend(resp.get("messages", []))
-        page_token = resp.get("nextPageToken")
 
-        if not page_token:
-            break
+# =========================================================
+# 🧵 THREAD CONTEXT (THREAD_AWARE)
+# =========================================================
 
-    messages = list(reversed(messages))
-    print(f"📩 Total fetched: {len(messages)} emails\n")
+def load_prior_state(service, message_id: str, thread_id: str, thread_messages: dict) -> str:
+    """
+    Summary of what earlier messages of the thread produced.
 
-    llm_count = 0
+    The first message of a thread has threadId == id and needs
+    no lookup; otherwise the thread's message IDs are fetched
+    once per run (threads.get, format="minimal").
+    """
+    if not thread_id or thread_id == message_id:
+        THREAD_STATS["first_messages"] += 1
+        return ""
 
-    # --------------------------------------------------
-    # 🔁 PROCESS EMAILS
-    # --------------------------------------------------
-    for idx, msg in enumerate(messages, start=1):
-        message_id = msg["id"]
+    if thread_id not in thread_messages:
+        THREAD_STATS["thread_lookups"] += 1
+        thread_messages[thread_id] = fetch_thread_message_ids(service, thread_id)
 
-        # --------------------------------------------------
-        # 1️⃣ METADATA FETCH (cheap)
-        # --------------------------------------------------
-        metadata = service.users().messages().get(
-            userId="me",
-            id=message_id,
-            format="metadata"
-        ).execute()
+    message_ids = thread_messages[thread_id]
+    if message_id in message_ids:
+        earlier_ids = message_ids[:message_ids.index(message_id)]
+    else:
+        earlier_ids = [m for m in message_ids if m != message_id]
 
-        label_ids = metadata.get("labelIds", [])
- 
+    return summarize_prior_state(load_thread_state(earlier_ids))
 
-        # --------------------------------------------------
-        # 2️⃣ FILTER NON-LLM EMAILS EARLY
-        # --------------------------------------------------
-        if not is_llm_worthy(label_ids):
-            continue
 
-        
-        # --------------------------------------------------
-        # 3️⃣ CHECK IF ALREADY PROCESSED (NEON-SAFE)
-        # --------------------------------------------------
-        conn = get_db_connection()
-        cur = conn.cursor()
-        try:
-            if email_already_processed(cur, message_id):
-                continue
-        finally:
-            cur.close()
-            conn.close()
+# =========================================================
+# 🧠 LLM ANALYSIS + STORAGE
+# =========================================================
+
+def analyze_and_persist(pending: list[dict]) -> tuple[list[str], bool]:
+    """
+    Analyzes the queued emails ({"email_data", "prompt_text"})
+    — batched in ANALYSIS_BATCH_MODE — and stores them in order.
+
+    Returns (failed message IDs, quota stopped). An ERROR payload
+    (LLM call or JSON extraction failed) counts as failed.
+    """
+    if not pending:
+        return [], False
+
+    payloads = None
+    if ANALYSIS_BATCH_MODE:
+        payloads = analyze_emails([
+            (item["email_data"]["gmail_message_id"], item["prompt_text"])
+            for item in pending
+        ])
+
+    failed = []
+    for item in pending:
+        email_data = item["email_data"]
+        message_id = email_data["gmail_message_id"]
 
         try:
-            # --------------------------------------------------
-            # 4️⃣ FULL EMAIL EXTRACTION
-            # --------------------------------------------------
-            email_data = get_clean_email_text(message_id)
-            snippet = metadata.get("snippet", "")
-            job_conf = compute_job_confidence(email_data["raw_text"])
-            print(f"⭐ Confidence={job_conf}% | snippet={snippet}")
-
-            if job_conf <= 0.5:
-                print("Skipping the mail due to low confidence")
+            if payloads is None:
+                payload = analyze_email(item["prompt_text"])
+            else:
+                payload = payloads.get(message_id)
+
+            # No result for this message → retried on the next run
+            if payload is None:
+                failed.append(message_id)
+                print(f"❌ No analysis returned for {message_id}")
                 continue
-            
-            llm_count += 1
-            print(f"\n🧠 Processing LLM email #{llm_count} | {message_id}")
-            # --------------------------------------------------
-            # 5️⃣ LLM ANALYSIS (STRICT PROMPT)
-            # --------------------------------------------------
-            payload = analyze_email(email_data["raw_text"])
-            print(payload)
 
-            time.sleep(2)  # throttle Gemini safely
-
-            # 🛑 LLM quota exhausted → STOP CLEANLY
+            # 🛑 Daily LLM quota exhausted → STOP CLEANLY
+            # (per-minute 429s are retried inside the dispatcher)
             if payload.get("email_type") == "LLM_QUOTA_EXHAUSTED":
                 print("\n🛑 Gemini quota exhausted. Stopping run safely.")
-                break
+                return failed, True
+
+            print(payload)
 
-            # ⚠️ Skip bad LLM output
-            if payload.get("email_type") in ("ERROR", "IGNORE"):
+            # ⚠️ Bad LLM output → retried on the next run
+            # (IGNORE is stored: emails table only, and it is a
+            # training label for the pre-classifier)
+            if payload.get("email_type") == "ERROR":
+                failed.append(message_id)
+                print(f"❌ LLM analysis failed for {message_id} → {payload.get('error')}")
                 continue
 
-            # --------------------------------------------------
-            # 6️⃣ INSERT / UPDATE DATABASE
-            # --------------------------------------------------
             persist_email_payload(
                 payload=payload,
-                gmail_message_id=email_data["gmail_message_id"],
+                gmail_message_id=message_id,
                 received_at=email_data["received_at"],
                 raw_body_text=email_data["raw_text"]
             )
 
-            print("✅ Stored successfully")
+            print(f"✅ Stored successfully | {message_id}")
 
         except Exception as e:
+            failed.append(message_id)
             print(f"❌ Failed for {message_id} → {e}")
 
-    print(f"\n🎯 TOTAL LLM-WORTHY EMAILS PROCESSED: {llm_count}")
+    return failed, False
+
+
+# =========================================================
+# 🚀 AUTOMATED PIPELINE (GEMINI ENABLED)
+# =========================================================
+
+def main():
+    service = get_gmail_service()
+    print("✅ Gmail service created\n")
+
+    # --------------------------------------------------
+    # 📩 LIST MESSAGES (HISTORY DELTA OR DATE WINDOW)
+    # --------------------------------------------------
+    next_history_id = None
+
+    if SYNC_MODE == "incremental":
+        messages, next_history_id = list_incremental_messages(
+            service, load_sync_state(HISTORY_STATE_KEY)
+        )
+    else:
+        messages = list_window_messages(service)
+
+    # Messages that failed on earlier runs are retried by ID
+    # (history.list will not return them again)
+    retry_ids = parse_retry_ids(load_sync_state(RETRY_STATE_KEY))
+    if retry_ids:
+        print(f"🔁 Retrying {len(retry_ids)} earlier failures")
+        messages = chain(
+            ({"id": message_id} for message_id in retry_ids),
+            (msg for msg in messages if msg["id"] not in retry_ids)
+        )
+
+    llm_count = 0
+    failed_ids = []
+    quota_stopped = False
+
+    # thread_id → message IDs, oldest first (one threads.get each)
+    thread_messages = {}
+
+    # --------------------------------------------------
+    # 🔁 PROCESS EMAILS (ONE METADATA BATCH AT A TIME)
+    # --------------------------------------------------
+    # 1️⃣ METADATA FETCH (cheap, batched)
+    for chunk in iter_metadata_chunks(service, messages):
+
+        # --------------------------------------------------
+        # 2️⃣ FILTER NON-LLM EMAILS EARLY
+        # --------------------------------------------------
+        chunk = [
+            (msg, metadata) for msg, metadata in chunk
+            if is_llm_worthy(metadata.get("labelIds", []))
+        ]
+
+        # --------------------------------------------------
+        # 3️⃣ CHECK IF ALREADY PROCESSED (NEON-SAFE)
+        # --------------------------------------------------
+        if chunk:
+            conn = get_db_connection()
+            cur = conn.cursor()
+            try:
+                chunk = [
+                    (msg, metadata) for msg, metadata in chunk
+                    if not email_already_processed(cur, msg["id"])
+                ]
+            finally:
+                cur.close()
+                conn.close()
+
+        # --------------------------------------------------
+        # 4️⃣ TIER 1: SUBJECT + SNIPPET CONFIDENCE
+        # --------------------------------------------------
+        chunk = [
+            (msg, metadata, tier)
+            for (msg, metadata), tier in zip(chunk, snippet_tiers(chunk))
+            if tier != "reject"
+        ]
+
+        # --------------------------------------------------
+        # 5️⃣ CONCURRENT FULL FETCH (QUOTA-AWARE)
+        # --------------------------------------------------
+        full_messages = fetch_full_messages([msg["id"] for msg, _, _ in chunk])
+
+        # Emails that passed every gate, waiting for the LLM
+        pending = []
+
+        for msg, metadata, tier in chunk:
+            message_id = msg["id"]
+
+            try:
+                # --------------------------------------------------
+                # 6️⃣ FULL EMAIL EXTRACTION
+                # --------------------------------------------------
+                full = full_messages[message_id]
+                if isinstance(full, Exception):
+                    raise full
+
+                thread_id = full.get("threadId")
+
+                prior_state = ""
+                if THREAD_AWARE:
+                    # An earlier turn still queued must be stored
+                    # before this one reads the thread state
+                    if thread_id and any(
+                        item["email_data"]["thread_id"] == thread_id
+                        for item in pending
+                    ):
+                        failed, quota_stopped = analyze_and_persist(pending)
+                        failed_ids += failed
+                        pending = []
+                        if quota_stopped:
+                            break
+
+                    prior_state = load_prior_state(
+                        service, message_id, thread_id, thread_messages
+                    )
+
+                # Quoted history is only dropped when the thread has
+                # recorded state to stand in for it. A reply to the
+                # user's own application, or to a mail that was
+                # filtered out, keeps the text naming company / role
+                email_data = clean_email_from_message(
+                    full, new_turn_only=bool(prior_state)
+                )
+
+                # --------------------------------------------------
+                # 7️⃣ TIER 2: FULL-TEXT CONFIDENCE (ESCALATED ONLY)
+                # --------------------------------------------------
+                if tier == "escalate":
+                    snippet = metadata.get("snippet", "")
+                    job_conf = compute_job_confidence(email_data["raw_text"])
+                    print(f"⭐ Confidence={job_conf}% | snippet={snippet}")
+
+                    # A reply in a thread that already produced an
+                    # opportunity is job-related even when the new
+                    # turn is short ("Thanks, see you Monday")
+                    if job_conf <= CONFIDENCE_THRESHOLD and not prior_state:
+                        CASCADE_STATS["full_rejected"] += 1
+                        print("Skipping the mail due to low confidence")
+                        continue
+
+                    CASCADE_STATS["full_accepted"] += 1
+
+                # --------------------------------------------------
+                # 8️⃣ TIER 3: LOCAL PRE-CLASSIFIER
+                # Not for known job threads: their replies are short
+                # and look like IGNORE out of context
+                # --------------------------------------------------
+                if USE_PRE_CLASSIFIER and not prior_state:
+                    skip, label, probability = should_skip_llm(email_data["raw_text"])
+                    if skip:
+                        CASCADE_STATS["classifier_skipped"] += 1
+                        print(f"🤖 Pre-classifier: {label} p={probability:.3f} → no LLM call")
+                        continue
+
+                llm_count += 1
+                print(f"\n🧠 Queued LLM email #{llm_count} | {message_id}")
+
+                # Over the per-email token budget → low-value
+                # chunks (footer, OCR) are left out of the prompt.
+                # The prior state block counts against the budget
+                prompt_text, cuts = assemble_prompt(
+                    email_data["sections"],
+                    reserved_tokens=(
+                        estimate_tokens(with_prior_state("", prior_state))
+                        if prior_state else 0
+                    )
+                )
+                if cuts:
+                    print(f"✂️ Prompt trimmed ({describe_cuts(cuts)} tokens cut)")
+
+                # --------------------------------------------------
+                # 9️⃣ LLM ANALYSIS (STRICT PROMPT) + 🔟 DATABASE
+                # --------------------------------------------------
+                pending.append({
+                    "email_data": email_data,
+                    "prompt_text": with_prior_state(prompt_text, prior_state)
+                })
+
+                if not ANALYSIS_BATCH_MODE:
+                    failed, quota_stopped = analyze_and_persist(pending)
+                    failed_ids += failed
+                    pending = []
+                    if quota_stopped:
+                        break
+
+            except Exception as e:
+                failed_ids.append(message_id)
+                print(f"❌ Failed for {message_id} → {e}")
+
+        if not quota_stopped:
+            failed, quota_stopped = analyze_and_persist(pending)
+            failed_ids += failed
+
+        if quota_stopped:
+            break
+
+    # --------------------------------------------------
+    # 🔖 ADVANCE historyId ONLY AFTER A COMPLETE RUN
+    # Failed messages do not pin it: they are kept by ID and
+    # retried next run. After a quota stop the rest of the delta
+    # was never reached, so the old historyId is kept. Both are
+    # written together: the historyId never moves past a message
+    # whose retry entry was not saved
+    # --------------------------------------------------
+    sync_state = {
+        RETRY_STATE_KEY: dump_retry_ids(update_retry_ids(
+            retry_ids, failed_ids, carried_over=retry_ids if quota_stopped else ()
+        ))
+    }
+    if next_history_id and not quota_stopped:
+        sync_state[HISTORY_STATE_KEY] = next_history_id
+
+    save_sync_states(sync_state)
+
+    if failed_ids:
+        print(f"🔁 {len(failed_ids)} failed emails queued for retry next run")
+    if HISTORY_STATE_KEY in sync_state:
+        print(f"🔖 Saved historyId {next_history_id}")
+
+    print(f"\n📩 Total fetched: {FETCH_STATS['metadata_messages']} emails")
+    print(f"🎯 TOTAL LLM-WORTHY EMAILS PROCESSED: {llm_count}")
+    print(f"⭐ Confidence cascade: {cascade_summary()}")
+    print(
+        f"📦 Metadata round trips: {FETCH_STATS['metadata_round_trips']} "
+        f"for {FETCH_STATS['metadata_messages']} emails"
+    )
+    print(
+        f"🔌 Gmail service builds: {SERVICE_STATS['service_builds']} | "
+        f"token refreshes: {SERVICE_STATS['token_refreshes']}"
+    )
+    print(
+        f"🗄️ Message cache: {MESSAGE_CACHE.summary()} "
+        f"(Gmail full fetches saved: {MESSAGE_CACHE.stats['hits']})"
+    )
+    print(
+        f"🧠 LLM cache: {LLM_CACHE.summary()} "
+        f"(Gemini calls saved: {LLM_CACHE.stats['hits']})"
+    )
+    print(f"🚦 LLM dispatcher: {LLM_DISPATCHER.summary()}")
+    print(f"🔢 LLM tokens: {usage_summary()}")
+    print(f"✂️ Prompt budget: {prompt_summary()}")
+    print(f"🖼️ OCR cache: {ocr_cache_summary()}")
+    print(f"🚫 OCR triage skips: {triage_summary()}")
+    if THREAD_AWARE:
+        print(f"🧵 Threads: {thread_summary()}")
 
 
 if __name__ == "__main__":
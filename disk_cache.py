@@ -0,0 +1,195 @@
+# disk_cache.py
+
+import atexit
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import zlib
+from collections import Counter
+
+from replay import REPLAY_MODE
+
+
+# =========================================================
+# 📁 CACHE LOCATION
+# =========================================================
+
+# Record / replay runs get an empty directory of their own: a
+# warm .cache answers calls before they reach the stand-ins, so
+# nothing would be recorded and replay would not be exercised
+if REPLAY_MODE in ("record", "replay"):
+    CACHE_DIR = tempfile.mkdtemp(prefix="email_agent_cache_")
+    atexit.register(shutil.rmtree, CACHE_DIR, ignore_errors=True)
+else:
+    CACHE_DIR = os.getenv("EMAIL_AGENT_CACHE_DIR", ".cache")
+
+
+# =========================================================
+# 🗄️ COMPRESSED SQLITE KEY/VALUE STORE
+# =========================================================
+
+class DiskCache:
+    """
+    Persistent key/value store in a single SQLite file.
+
+    - values are zlib-compressed JSON
+    - keys are indexed (PRIMARY KEY)
+    - when the stored size exceeds max_bytes, the least recently
+      used entries are evicted
+    - hits / misses / evictions are counted in self.stats
+
+    The stored size is kept as a running total in memory (loaded
+    once per connection), so a write does not sum the table.
+    size sits before the value BLOB, and (accessed_at, size, key)
+    is a covering index: sums and eviction scans never read
+    values.
+    """
+
+    def __init__(self, name: str, max_bytes: int):
+        os.makedirs(CACHE_DIR, exist_ok=True)
+
+        self.path = os.path.join(CACHE_DIR, f"{name}.sqlite3")
+        self.max_bytes = max_bytes
+        self.stats = Counter()
+
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+        self._total = 0
+
+    def _connection(self):
+        # Connections must not cross a fork
+        if self._conn is None or self._pid != os.getpid():
+            self._conn = sqlite3.connect(
+                self.path, timeout=30, check_same_thread=False
+            )
+            self._conn.execute("PRAGMA journal_mode=WAL;")
+
+            # Files from before the column reorder are dropped
+            # (it is a cache)
+            columns = [
+                row[1] for row in
+                self._conn.execute("PRAGMA table_info(entries);")
+            ]
+            if columns and columns[1] != "size":
+                self._conn.execute("DROP TABLE entries;")
+
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS entries (
+                    key TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL,
+                    value BLOB NOT NULL
+                );
+                """
+            )
+            self._conn.execute("DROP INDEX IF EXISTS entries_accessed;")
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS entries_lru "
+                "ON entries (accessed_at, size, key);"
+            )
+            self._conn.commit()
+            self._pid = os.getpid()
+            self._total = self._stored_bytes(self._conn)
+
+        return self._conn
+
+    @staticmethod
+    def _stored_bytes(conn) -> int:
+        return conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM entries;"
+        ).fetchone()[0]
+
+    def get(self, key: str, max_age: float | None = None):
+        """
+        Returns the cached value, or None on a miss. Entries older
+        than max_age seconds count as misses.
+        """
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute(
+                "SELECT value, created_at FROM entries WHERE key = ?;",
+                (key,)
+            ).fetchone()
+
+            if row is None or (
+                max_age is not None and time.time() - row[1] > max_age
+            ):
+                self.stats["misses"] += 1
+                return None
+
+            conn.execute(
+                "UPDATE entries SET accessed_at = ? WHERE key = ?;",
+                (time.time(), key)
+            )
+            conn.commit()
+            self.stats["hits"] += 1
+
+        return json.loads(zlib.decompress(row[0]))
+
+    def set(self, key: str, value) -> None:
+        blob = zlib.compress(json.dumps(value).encode("utf-8"))
+        now = time.time()
+
+        with self._lock:
+            conn = self._connection()
+            previous = conn.execute(
+                "SELECT size FROM entries WHERE key = ?;", (key,)
+            ).fetchone()
+            conn.execute(
+                """
+                INSERT INTO entries (key, size, created_at, accessed_at, value)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (key)
+                DO UPDATE SET
+                    size = excluded.size,
+                    created_at = excluded.created_at,
+                    accessed_at = excluded.accessed_at,
+                    value = excluded.value;
+                """,
+                (key, len(blob), now, now, blob)
+            )
+            self._total += len(blob) - (previous[0] if previous else 0)
+
+            if self._total > self.max_bytes:
+                self._evict(conn)
+            conn.commit()
+            self.stats["writes"] += 1
+
+    def _evict(self, conn) -> None:
+        # Exact total first: other processes may share the file
+        total = self._stored_bytes(conn)
+
+        # Trim to 90% so eviction does not run on every write
+        target = int(self.max_bytes * 0.9)
+        rows = conn.execute(
+            "SELECT key, size FROM entries ORDER BY accessed_at;"
+        )
+
+        doomed = []
+        for key, size in rows:
+            if total <= target:
+                break
+            doomed.append((key,))
+            total -= size
+
+        conn.executemany("DELETE FROM entries WHERE key = ?;", doomed)
+        self._total = total
+        self.stats["evictions"] += len(doomed)
+
+    def hit_rate(self) -> float:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return self.stats["hits"] / lookups if lookups else 0.0
+
+    def summary(self) -> str:
+        return (
+            f"hits={self.stats['hits']} misses={self.stats['misses']} "
+            f"hit_rate={self.hit_rate():.0%} "
+            f"evictions={self.stats['evictions']}"
+        )
@@ -1,7 +1,31 @@
 import json
 import re
-from LLM_Gemini import call_llm, LLMQuotaExhausted
-from prompts import FINAL_ANALYSIS_PROMPT
+from LLM_Gemini import LLMQuotaExhausted, MODEL_NAME
+from llm_cache import get_cached_analysis, store_analysis
+from llm_dispatcher import LLM_DISPATCHER
+from llm_usage import estimate_tokens
+from prompts import FINAL_ANALYSIS_PROMPT, BATCH_ANALYSIS_PROMPT
+
+
+# =========================================================
+# ⚙️ BATCH ANALYSIS SETTINGS
+# One request for several emails: FINAL_ANALYSIS_PROMPT and the
+# per-request overhead are paid once per batch.
+# =========================================================
+
+BATCH_MAX_EMAILS = 8
+BATCH_TOKEN_BUDGET = 24_000     # email content per request
+
+EMAIL_TYPES = {"JOB_PIPELINE", "LINKEDIN_NETWORKING", "IGNORE"}
+PIPELINE_STAGES = {
+    "OPPORTUNITY_FOUND",
+    "APPLIED",
+    "SHORTLISTED",
+    "ASSESSMENT",
+    "INTERVIEW",
+    "SELECTED",
+    "REJECTED"
+}
 
 
 def extract_json(text: str) -> dict:
@@ -24,11 +48,32 @@ def extract_json(text: str) -> dict:
     return json.loads(text[first:last + 1])
 
 
+def build_content(clean_email_text: str) -> str:
+    return "EMAIL CONTENT:\n" + clean_email_text
+
+
+def build_prompt(clean_email_text: str) -> str:
+    """
+    The prompt as one string (cache key). It is sent as
+    FINAL_ANALYSIS_PROMPT (system instruction) + build_content.
+    """
+    return FINAL_ANALYSIS_PROMPT + "\n\n" + build_content(clean_email_text)
+
+
 def analyze_email(clean_email_text: str) -> dict:
-    prompt = FINAL_ANALYSIS_PROMPT + "\n\nEMAIL CONTENT:\n" + clean_email_text
+    prompt = build_prompt(clean_email_text)
+
+    # Same model + prompt version + prompt → no Gemini call
+    cached = get_cached_analysis(MODEL_NAME, prompt)
+    if cached is not None:
+        return cached["payload"]
 
     try:
-        raw_response = call_llm(prompt)
+        # Paced, retried and bounded by the shared dispatcher
+        raw_response = LLM_DISPATCHER.call(
+            build_content(clean_email_text),
+            system_instruction=FINAL_ANALYSIS_PROMPT
+        )
 
     except LLMQuotaExhausted as e:
         return {
@@ -44,6 +89,9 @@ def analyze_email(clean_email_text: str) -> dict:
 
     try:
         payload = extract_json(raw_response)
+
+        # Only parsed answers are cached; errors are retried
+        store_analysis(MODEL_NAME, prompt, raw_response, payload)
         return payload
 
     except Exception as e:
@@ -52,3 +100,171 @@ def analyze_email(clean_email_text: str) -> dict:
             "error": f"JSON extraction failed: {e}",
             "raw_response": raw_response[:500]
         }
+
+
+# =========================================================
+# ✅ PAYLOAD VALIDATION
+# =========================================================
+
+def validate_payload(payload) -> str | None:
+    """
+    Returns what is wrong with a payload, or None if it matches
+    the schema in FINAL_ANALYSIS_PROMPT closely enough to persist.
+    """
+    if not isinstance(payload, dict):
+        return "not an object"
+
+    email_type = payload.get("email_type")
+    if email_type not in EMAIL_TYPES:
+        return f"unknown email_type {email_type!r}"
+
+    if email_type == "JOB_PIPELINE":
+        opportunities = payload.get("opportunities")
+        if not isinstance(opportunities, list):
+            return "opportunities is not a list"
+        for opp in opportunities:
+            if not isinstance(opp, dict) or not opp.get("company"):
+                return "opportunity without company"
+            if opp.get("pipeline_stage") not in PIPELINE_STAGES:
+                return f"unknown pipeline_stage {opp.get('pipeline_stage')!r}"
+
+    if email_type == "LINKEDIN_NETWORKING":
+        if not isinstance(payload.get("linkedin_event"), dict):
+            return "linkedin_event is not an object"
+
+    return None
+
+
+# =========================================================
+# 📦 BATCH ANALYSIS (N EMAILS, ONE REQUEST)
+# =========================================================
+
+def extract_json_array(text: str) -> list:
+    if not text:
+        raise ValueError("Empty LLM response")
+
+    text = text.strip()
+    first = text.find("[")
+    last = text.rfind("]")
+
+    if first == -1 or last == -1:
+        raise ValueError("No JSON array found")
+
+    result = json.loads(text[first:last + 1])
+    if not isinstance(result, list):
+        raise ValueError("Not a JSON array")
+    return result
+
+
+def pack_batches(emails: list[tuple[str, str]]) -> list[list[tuple[str, str]]]:
+    """
+    Groups (message_id, text) in order into batches of at most
+    BATCH_MAX_EMAILS emails and BATCH_TOKEN_BUDGET tokens. An
+    email over the budget gets a batch of its own.
+    """
+    batches = []
+    current, current_tokens = [], 0
+
+    for message_id, text in emails:
+        tokens = estimate_tokens(text)
+
+        if current and (
+            len(current) == BATCH_MAX_EMAILS
+            or current_tokens + tokens > BATCH_TOKEN_BUDGET
+        ):
+            batches.append(current)
+            current, current_tokens = [], 0
+
+        current.append((message_id, text))
+        current_tokens += tokens
+
+    if current:
+        batches.append(current)
+
+    return batches
+
+
+BATCH_SYSTEM_INSTRUCTION = FINAL_ANALYSIS_PROMPT + BATCH_ANALYSIS_PROMPT
+
+
+def _batch_content(batch: list[tuple[str, str]]) -> str:
+    return "\n\n".join(
+        f"=== EMAIL {message_id} ===\n{text}" for message_id, text in batch
+    )
+
+
+def _analyze_batch(batch: list[tuple[str, str]]) -> dict:
+    """
+    {message_id: payload} for one request; entries that are
+    missing or fail validation are analyzed one by one.
+    """
+    raw_response = LLM_DISPATCHER.call(
+        _batch_content(batch), system_instruction=BATCH_SYSTEM_INSTRUCTION
+    )
+
+    entries = {}
+    try:
+        for entry in extract_json_array(raw_response):
+            if isinstance(entry, dict) and entry.get("message_id") is not None:
+                entries[str(entry.pop("message_id"))] = entry
+    except Exception as e:
+        print(f"⚠️ Batch response unusable → per-email fallback ({e})")
+
+    results = {}
+    for message_id, text in batch:
+        payload = entries.get(message_id)
+        problem = validate_payload(payload) if payload is not None else "missing"
+
+        if problem is None:
+            # Cached under the single-email prompt, so a later
+            # single or batch run finds it
+            store_analysis(MODEL_NAME, build_prompt(text), json.dumps(payload), payload)
+            results[message_id] = payload
+        else:
+            print(f"↩️ {message_id}: {problem} → single analysis")
+            results[message_id] = analyze_email(text)
+
+    return results
+
+
+def analyze_emails(emails: list[tuple[str, str]]) -> dict:
+    """
+    Batched analyze_email for (message_id, clean_email_text)
+    pairs. Returns {message_id: payload} with the same payload
+    shapes (including LLM_QUOTA_EXHAUSTED / ERROR).
+    """
+    results = {}
+    pending = []
+
+    for message_id, text in emails:
+        cached = get_cached_analysis(MODEL_NAME, build_prompt(text))
+        if cached is not None:
+            results[message_id] = cached["payload"]
+        else:
+            pending.append((message_id, text))
+
+    # Batches run concurrently (up to LLM_MAX_IN_FLIGHT), paced
+    # by the dispatcher's RPM / TPM budget
+    for batch_results in LLM_DISPATCHER.map(_analyze_packed, pack_batches(pending)):
+        results.update(batch_results)
+
+    return results
+
+
+def _analyze_packed(batch: list[tuple[str, str]]) -> dict:
+    if len(batch) == 1:
+        message_id, text = batch[0]
+        return {message_id: analyze_email(text)}
+
+    try:
+        return _analyze_batch(batch)
+
+    except LLMQuotaExhausted as e:
+        return {
+            message_id: {"email_type": "LLM_QUOTA_EXHAUSTED", "error": str(e)}
+            for message_id, _ in batch
+        }
+
+    except Exception as e:
+        print(f"⚠️ Batch request failed → per-email fallback ({e})")
+        return {message_id: analyze_email(text) for message_id, text in batch}
@@ -0,0 +1,292 @@
+# gmail_fetch.py
+
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from googleapiclient.errors import HttpError
+
+from Connection import get_gmail_service
+import gmail_quota
+from gmail_quota import QUOTA_UNITS, execute_with_backoff, is_throttled
+from message_cache import fetch_full_message
+
+
+# =========================================================
+# ⚙️ BATCH SETTINGS
+# Gmail accepts up to 100 calls per batch, but recommends
+# staying at or below 50 to avoid per-user rate limiting.
+# =========================================================
+
+BATCH_SIZE = 50
+METADATA_HEADERS = ["From", "Subject", "Date"]
+
+# Sub-window size for oldest-first listing; only one sub-window
+# is ever held in memory
+LIST_WINDOW_DAYS = 1
+
+# Concurrent format="full" fetches (each worker thread has its
+# own Gmail service; the quota bucket is shared)
+MAX_IN_FLIGHT = 8
+
+# Round trips / messages fetched during this process
+FETCH_STATS = Counter()
+
+
+# =========================================================
+# 📩 STREAMING MESSAGE LISTING
+# =========================================================
+
+def iter_messages(service, query: str, page_size: int = 500):
+    """
+    Yields listed messages as each page arrives (Gmail order,
+    newest first).
+    """
+    page_token = None
+
+    while True:
+        resp = execute_with_backoff(
+            service.users().messages().list(
+                userId="me",
+                q=query,
+                maxResults=page_size,
+                pageToken=page_token
+            ),
+            "messages.list"
+        )
+        FETCH_STATS["list_round_trips"] += 1
+
+        yield from resp.get("messages", [])
+        page_token = resp.get("nextPageToken")
+
+        if not page_token:
+            break
+
+
+def iter_messages_oldest_first(
+    service,
+    start_date: str,
+    end_date: str,
+    base_query: str = "in:inbox",
+    page_size: int = 500,
+    window_days: int = LIST_WINDOW_DAYS
+):
+    """
+    Yields messages between start_date (inclusive) and end_date
+    (exclusive), both "YYYY/MM/DD", oldest first.
+
+    The range is walked in window_days sub-windows and only the
+    current sub-window is reversed, so memory stays bounded by
+    one sub-window instead of the whole range.
+    """
+    start = datetime.strptime(start_date, "%Y/%m/%d").date()
+    end = datetime.strptime(end_date, "%Y/%m/%d").date()
+
+    while start < end:
+        stop = min(start + timedelta(days=window_days), end)
+        query = (
+            f"{base_query} after:{start:%Y/%m/%d} before:{stop:%Y/%m/%d}"
+        )
+
+        yield from reversed(list(iter_messages(service, query, page_size)))
+        start = stop
+
+
+# =========================================================
+# 📦 BATCHED METADATA FETCH
+# =========================================================
+
+def _metadata_request(service, message_id: str, metadata_headers):
+    return service.users().messages().get(
+        userId="me",
+        id=message_id,
+        format="metadata",
+        metadataHeaders=metadata_headers
+    )
+
+
+def fetch_metadata_batch(
+    service,
+    message_ids: list[str],
+    metadata_headers: list[str] = METADATA_HEADERS
+) -> dict:
+    """
+    Fetches labels, snippet and the given headers for many
+    message IDs using Gmail batch requests (BATCH_SIZE per
+    HTTP round trip).
+
+    Returns {message_id: metadata}. A failed batch POST is
+    retried whole with backoff. Calls that fail inside a batch
+    are retried individually with backoff, and throttled ones
+    slow the shared quota bucket down; messages that no longer
+    exist are left out.
+    """
+    results = {}
+    failed = []
+    throttled = []
+
+    def on_response(request_id, response, exception):
+        if exception is not None:
+            failed.append(request_id)
+            if isinstance(exception, HttpError) and is_throttled(exception):
+                throttled.append(request_id)
+        else:
+            results[request_id] = response
+
+    unique_ids = list(dict.fromkeys(message_ids))
+
+    for start in range(0, len(unique_ids), BATCH_SIZE):
+        batch = service.new_batch_http_request(callback=on_response)
+
+        batch_ids = unique_ids[start:start + BATCH_SIZE]
+
+        for message_id in batch_ids:
+            batch.add(
+                _metadata_request(service, message_id, metadata_headers),
+                request_id=message_id
+            )
+
+        # Every call inside a batch is charged separately
+        execute_with_backoff(
+            batch, "batch",
+            units=QUOTA_UNITS["messages.get"] * len(batch_ids)
+        )
+        FETCH_STATS["metadata_round_trips"] += 1
+
+        # Once per batch: halving per throttled call would drop
+        # straight to the minimum rate
+        if throttled:
+            FETCH_STATS["metadata_throttled"] += len(throttled)
+            gmail_quota.GMAIL_QUOTA.on_throttle()
+            throttled.clear()
+
+    for message_id in failed:
+        FETCH_STATS["metadata_round_trips"] += 1
+        FETCH_STATS["metadata_retries"] += 1
+        try:
+            results[message_id] = execute_with_backoff(
+                _metadata_request(service, message_id, metadata_headers),
+                "messages.get"
+            )
+        except HttpError as e:
+            # Deleted since listing (common with history sync)
+            if e.resp.status != 404:
+                raise
+
+    FETCH_STATS["metadata_messages"] += len(results)
+    return results
+
+
+def iter_metadata_chunks(
+    service,
+    messages,
+    metadata_headers: list[str] = METADATA_HEADERS
+):
+    """
+    Yields lists of (msg, metadata) for up to BATCH_SIZE listed
+    messages at a time, in order, skipping messages that no
+    longer exist.
+    """
+    chunk = []
+
+    for msg in messages:
+        chunk.append(msg)
+
+        if len(chunk) == BATCH_SIZE:
+            yield _with_metadata(service, chunk, metadata_headers)
+            chunk = []
+
+    if chunk:
+        yield _with_metadata(service, chunk, metadata_headers)
+
+
+def _with_metadata(service, chunk, metadata_headers):
+    metadata = fetch_metadata_batch(
+        service, [m["id"] for m in chunk], metadata_headers
+    )
+    return [(m, metadata[m["id"]]) for m in chunk if m["id"] in metadata]
+
+
+def iter_with_metadata(
+    service,
+    messages,
+    metadata_headers: list[str] = METADATA_HEADERS
+):
+    """
+    Yields (msg, metadata) for every listed message that still
+    exists, in order, fetching metadata BATCH_SIZE at a time.
+    """
+    for chunk in iter_metadata_chunks(service, messages, metadata_headers):
+        yield from chunk
+
+
+# =========================================================
+# 🧵 THREADS
+# =========================================================
+
+def fetch_thread_message_ids(service, thread_id: str) -> list[str]:
+    """
+    Message IDs of a thread, oldest first (format="minimal":
+    IDs and labels only, no bodies).
+    """
+    thread = execute_with_backoff(
+        service.users().threads().get(
+            userId="me",
+            id=thread_id,
+            format="minimal"
+        ),
+        "threads.get"
+    )
+    FETCH_STATS["thread_round_trips"] += 1
+    return [msg["id"] for msg in thread.get("messages", [])]
+
+
+# =========================================================
+# 🚚 CONCURRENT FULL-MESSAGE FETCH
+# =========================================================
+
+_fetch_pool = None
+_fetch_pool_lock = threading.Lock()
+
+
+def _get_fetch_pool() -> ThreadPoolExecutor:
+    # One long-lived pool, so per-thread Gmail services are reused
+    global _fetch_pool
+
+    with _fetch_pool_lock:
+        if _fetch_pool is None:
+            _fetch_pool = ThreadPoolExecutor(
+                max_workers=MAX_IN_FLIGHT,
+                thread_name_prefix="gmail-fetch"
+            )
+        return _fetch_pool
+
+
+def _fetch_full(message_id: str) -> dict:
+    return fetch_full_message(get_gmail_service(), message_id)
+
+
+def fetch_full_messages(message_ids: list[str]) -> dict:
+    """
+    Fetches format="full" messages with up to MAX_IN_FLIGHT
+    requests in flight, under the shared Gmail quota bucket.
+
+    Returns {message_id: message}; a message that could not be
+    fetched maps to the raised exception instead.
+    """
+    pool = _get_fetch_pool()
+    futures = {
+        message_id: pool.submit(_fetch_full, message_id)
+        for message_id in dict.fromkeys(message_ids)
+    }
+
+    results = {}
+    for message_id, future in futures.items():
+        try:
+            results[message_id] = future.result()
+        except Exception as e:
+            results[message_id] = e
+
+    FETCH_STATS["full_messages"] += len(results)
+    return results
@@ -0,0 +1,83 @@
+# gmail_quota.py
+
+import time
+from collections import Counter
+
+from googleapiclient.errors import HttpError
+
+from rate_limit import TokenBucket, backoff_delay
+
+
+# =========================================================
+# ⚙️ GMAIL QUOTA SETTINGS
+# Gmail charges quota units per method; the per-user limit is
+# 250 units per second (moving average).
+# =========================================================
+
+QUOTA_UNITS_PER_SECOND = 250
+
+QUOTA_UNITS = {
+    "messages.get": 5,
+    "messages.list": 5,
+    "history.list": 2,
+    "threads.get": 10,
+    "getProfile": 1
+}
+
+MAX_RETRIES = 5
+BACKOFF_BASE_SECONDS = 1.0
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+# throttled / server_errors / retries
+QUOTA_STATS = Counter()
+
+GMAIL_QUOTA = TokenBucket(
+    rate=QUOTA_UNITS_PER_SECOND,
+    capacity=QUOTA_UNITS_PER_SECOND
+)
+
+
+def is_throttled(error: HttpError) -> bool:
+    if error.resp.status == 429:
+        return True
+    # Gmail also reports per-user rate limits as 403
+    # ("rateLimitExceeded" / "User-rate limit exceeded")
+    message = str(error).lower().replace(" ", "").replace("-", "")
+    return error.resp.status == 403 and "ratelimitexceeded" in message
+
+
+def execute_with_backoff(request, method: str, units: float = None):
+    """
+    Executes a Gmail API request (or a batch: pass the units of
+    all its calls) after reserving its quota units.
+
+    429 / rate-limit 403 responses slow the shared bucket down;
+    those and 5xx responses are retried with jittered exponential
+    backoff, up to MAX_RETRIES times.
+    """
+    if units is None:
+        units = QUOTA_UNITS.get(method, 5)
+
+    for attempt in range(MAX_RETRIES + 1):
+        GMAIL_QUOTA.acquire(units)
+
+        try:
+            result = request.execute()
+            GMAIL_QUOTA.on_success()
+            return result
+
+        except HttpError as e:
+            throttled = is_throttled(e)
+            retryable = throttled or e.resp.status in RETRYABLE_STATUSES
+
+            if throttled:
+                QUOTA_STATS["throttled"] += 1
+                GMAIL_QUOTA.on_throttle()
+            elif retryable:
+                QUOTA_STATS["server_errors"] += 1
+
+            if not retryable or attempt == MAX_RETRIES:
+                raise
+
+            QUOTA_STATS["retries"] += 1
+            time.sleep(backoff_delay(attempt, base=BACKOFF_BASE_SECONDS))
@@ -0,0 +1,169 @@
+# gmail_sync.py
+
+import json
+from itertools import islice
+
+from googleapiclient.errors import HttpError
+
+from gmail_fetch import iter_messages
+from gmail_quota import execute_with_backoff
+
+
+# =========================================================
+# ⚙️ INCREMENTAL SYNC SETTINGS
+# =========================================================
+
+HISTORY_STATE_KEY = "gmail_last_history_id"
+
+# Bounded full list used on the first run and whenever the
+# stored historyId has expired (Gmail keeps roughly a week)
+FALLBACK_QUERY = "in:inbox newer_than:7d"
+FALLBACK_MAX_EMAILS = 500
+
+
+# Messages whose analysis failed are retried by ID on later runs
+# instead of pinning the historyId; after MAX_RETRY_ATTEMPTS
+# failed runs a message is given up on. The retry map is stored
+# as JSON in sync_state next to the historyId, and saved in the
+# same transaction that advances it
+RETRY_STATE_KEY = "retry_message_ids"
+MAX_RETRY_ATTEMPTS = 5
+
+
+class HistoryExpired(Exception):
+    pass
+
+
+# =========================================================
+# 🔖 HISTORY HELPERS
+# =========================================================
+
+def get_current_history_id(service) -> str:
+    profile = execute_with_backoff(
+        service.users().getProfile(userId="me"), "getProfile"
+    )
+    return str(profile["historyId"])
+
+
+def list_history_messages(service, start_history_id: str) -> list[dict]:
+    """
+    Returns messages added to (or relabeled into) the inbox since
+    start_history_id, oldest first, without duplicates.
+
+    Raises HistoryExpired when Gmail no longer has that history.
+    """
+    messages = {}
+    page_token = None
+
+    while True:
+        try:
+            resp = execute_with_backoff(
+                service.users().history().list(
+                    userId="me",
+                    startHistoryId=start_history_id,
+                    labelId="INBOX",
+                    historyTypes=["messageAdded", "labelAdded"],
+                    maxResults=500,
+                    pageToken=page_token
+                ),
+                "history.list"
+            )
+
+        except HttpError as e:
+            if e.resp.status == 404:
+                raise HistoryExpired(
+                    f"historyId {start_history_id} is no longer available"
+                )
+            raise
+
+        for record in resp.get("history", []):
+            for added in record.get("messagesAdded", []):
+                msg = added["message"]
+                messages.setdefault(msg["id"], msg)
+
+            for added in record.get("labelsAdded", []):
+                msg = added["message"]
+                messages.setdefault(msg["id"], msg)
+
+        page_token = resp.get("nextPageToken")
+        if not page_token:
+            break
+
+    return list(messages.values())
+
+
+def list_fallback_messages(service) -> list[dict]:
+    """
+    Bounded full listing (FALLBACK_QUERY), oldest first.
+    """
+    messages = list(islice(
+        iter_messages(service, FALLBACK_QUERY, FALLBACK_MAX_EMAILS),
+        FALLBACK_MAX_EMAILS
+    ))
+    return list(reversed(messages))
+
+
+# =========================================================
+# 🔄 INCREMENTAL LISTING
+# =========================================================
+
+def list_incremental_messages(
+    service,
+    last_history_id: str | None
+) -> tuple[list[dict], str]:
+    """
+    Returns (messages, current_history_id).
+
+    The current historyId is read BEFORE listing, so anything
+    arriving mid-run is picked up again on the next run.
+    """
+    current_history_id = get_current_history_id(service)
+
+    if not last_history_id:
+        print("🔖 No stored historyId → bounded full list")
+        return list_fallback_messages(service), current_history_id
+
+    try:
+        messages = list_history_messages(service, last_history_id)
+        print(f"🔖 History delta since {last_history_id}: {len(messages)}")
+        return messages, current_history_id
+
+    except HistoryExpired as e:
+        print(f"⚠️ {e} → bounded full list")
+        return list_fallback_messages(service), current_history_id
+
+
+# =========================================================
+# 🔁 FAILED-MESSAGE RETRIES
+# =========================================================
+
+def parse_retry_ids(value: str | None) -> dict:
+    """{message_id: failed runs so far} from the stored JSON."""
+    return json.loads(value) if value else {}
+
+
+def dump_retry_ids(retry_ids: dict) -> str:
+    return json.dumps(retry_ids, sort_keys=True)
+
+
+def update_retry_ids(retry_ids: dict, failed_ids, carried_over=()) -> dict:
+    """
+    The retry set for the next run: failed_ids are added (or
+    counted up), carried_over entries (not reached this run) are
+    kept as they are, the other earlier entries are dropped.
+    """
+    failed_ids = set(failed_ids)
+    updated = {
+        message_id: retry_ids[message_id]
+        for message_id in carried_over
+        if message_id in retry_ids and message_id not in failed_ids
+    }
+
+    for message_id in failed_ids:
+        attempts = retry_ids.get(message_id, 0) + 1
+        if attempts > MAX_RETRY_ATTEMPTS:
+            print(f"⚠️ Giving up on {message_id} after {MAX_RETRY_ATTEMPTS} failed runs")
+            continue
+        updated[message_id] = attempts
+
+    return updated
@@ -0,0 +1,150 @@
+# html_backends.py
+
+import os
+
+from bs4 import BeautifulSoup
+
+try:
+    import lxml.html
+except ImportError:
+    lxml = None
+
+try:
+    from selectolax.parser import HTMLParser
+except ImportError:
+    HTMLParser = None
+
+
+# =========================================================
+# ⚙️ BACKEND SELECTION
+# "bs4" (html.parser) is the reference implementation;
+# "lxml" and "selectolax" are faster optional backends and fall
+# back to bs4 when their package is not installed.
+# =========================================================
+
+HTML_BACKEND = os.getenv("EMAIL_AGENT_HTML_BACKEND", "bs4")
+
+# Elements whose contents bs4's get_text() does not treat as text
+NON_TEXT_TAGS = {"script", "style", "template"}
+
+
+def _image(src, width, height) -> dict:
+    return {"src": src, "width": width, "height": height}
+
+
+# =========================================================
+# 🥣 BS4 (REFERENCE)
+# =========================================================
+
+def parse_bs4(html_content: str) -> tuple[str, list[dict]]:
+    soup = BeautifulSoup(html_content, "html.parser")
+
+    visible_text = soup.get_text(separator="\n", strip=True)
+    images = [
+        _image(img.get("src"), img.get("width"), img.get("height"))
+        for img in soup.find_all("img") if img.get("src")
+    ]
+    return visible_text, images
+
+
+# =========================================================
+# ⚡ LXML
+# =========================================================
+
+def _lxml_strings(element):
+    # Same order as bs4: own text, children, then tail (which
+    # belongs to the parent and is always visible)
+    if isinstance(element.tag, str) and element.tag not in NON_TEXT_TAGS:
+        if element.text:
+            yield element.text
+        for child in element:
+            yield from _lxml_strings(child)
+
+    if element.tail:
+        yield element.tail
+
+
+def parse_lxml(html_content: str) -> tuple[str, list[dict]]:
+    try:
+        root = lxml.html.document_fromstring(html_content)
+    except (ValueError, lxml.etree.ParserError):
+        # e.g. an XML encoding declaration inside a str
+        return parse_bs4(html_content)
+
+    visible_text = "\n".join(
+        text for text in (s.strip() for s in _lxml_strings(root)) if text
+    )
+    images = [
+        _image(img.get("src"), img.get("width"), img.get("height"))
+        for img in root.iter("img") if img.get("src")
+    ]
+    return visible_text, images
+
+
+# =========================================================
+# 🚀 SELECTOLAX (LEXBOR)
+# =========================================================
+
+def parse_selectolax(html_content: str) -> tuple[str, list[dict]]:
+    tree = HTMLParser(html_content)
+    tree.strip_tags(list(NON_TEXT_TAGS))
+
+    visible_text = ""
+    if tree.root is not None:
+        visible_text = tree.root.text(separator="\n", strip=True)
+        visible_text = "\n".join(
+            line for line in visible_text.split("\n") if line
+        )
+
+    images = [
+        _image(
+            img.attributes.get("src"),
+            img.attributes.get("width"),
+            img.attributes.get("height")
+        )
+        for img in tree.css("img") if img.attributes.get("src")
+    ]
+    return visible_text, images
+
+
+# =========================================================
+# 🔌 DISPATCH
+# =========================================================
+
+BACKENDS = {
+    "bs4": parse_bs4,
+    "lxml": parse_lxml,
+    "selectolax": parse_selectolax
+}
+
+AVAILABLE = {
+    "bs4": True,
+    "lxml": lxml is not None,
+    "selectolax": HTMLParser is not None
+}
+
+
+_warned = set()
+
+
+def get_parser(name: str = None):
+    name = name or HTML_BACKEND
+
+    if not AVAILABLE.get(name):
+        if name not in _warned:
+            print(f"⚠️ HTML backend '{name}' unavailable → using bs4")
+            _warned.add(name)
+        name = "bs4"
+
+    return BACKENDS[name]
+
+
+def parse_html(html_content: str, backend: str = None) -> tuple[str, list[dict]]:
+    """
+    Parses HTML once and returns (visible_text, images), where
+    images are {"src", "width", "height"} dicts in document order.
+    """
+    if not html_content:
+        return "", []
+
+    return get_parser(backend)(html_content)
@@ -0,0 +1,91 @@
+# image_download.py
+
+import threading
+from collections import defaultdict
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from image_triage import triage_headers, triage_body_size
+
+
+# =========================================================
+# ⚙️ DOWNLOAD SETTINGS
+# One pooled session for all image downloads (keep-alive, no
+# new TCP/TLS handshake per image), bodies streamed under a
+# hard byte cap, and a per-host cap on concurrent downloads.
+# =========================================================
+
+DOWNLOAD_TIMEOUT_SECONDS = 5
+PER_HOST_CONCURRENCY = 4
+POOLED_HOSTS = 32
+CHUNK_SIZE = 64 * 1024
+
+_session = None
+_session_lock = threading.Lock()
+
+_host_slots = defaultdict(lambda: threading.BoundedSemaphore(PER_HOST_CONCURRENCY))
+_host_slots_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    global _session
+
+    with _session_lock:
+        if _session is None:
+            adapter = HTTPAdapter(
+                pool_connections=POOLED_HOSTS,
+                pool_maxsize=PER_HOST_CONCURRENCY
+            )
+            _session = requests.Session()
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+        return _session
+
+
+def _host_slot(url: str) -> threading.BoundedSemaphore:
+    with _host_slots_lock:
+        return _host_slots[urlsplit(url).hostname or ""]
+
+
+def download_image(url: str) -> tuple[bytes | None, str | None]:
+    """
+    Returns (data, skip_reason).
+
+    Non-image content types and bodies outside the allowed size
+    are rejected from the headers, or as soon as the streamed
+    body passes the cap. Network errors return (None, None).
+    """
+    slot = _host_slot(url)
+    if not slot.acquire(timeout=DOWNLOAD_TIMEOUT_SECONDS):
+        return None, None
+
+    try:
+        with get_session().get(
+            url, timeout=DOWNLOAD_TIMEOUT_SECONDS, stream=True
+        ) as response:
+            if response.status_code != 200:
+                return None, None
+
+            reason = triage_headers(response.headers)
+            if reason:
+                return None, reason
+
+            chunks = []
+            size = 0
+            for chunk in response.iter_content(CHUNK_SIZE):
+                chunks.append(chunk)
+                size += len(chunk)
+
+                reason = triage_body_size(size)
+                if reason:
+                    return None, reason
+
+            return b"".join(chunks), None
+
+    except requests.RequestException:
+        return None, None
+
+    finally:
+        slot.release()
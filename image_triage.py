@@ -0,0 +1,200 @@
+# image_triage.py
+
+import os
+import re
+from collections import Counter
+from io import BytesIO
+from urllib.parse import urlsplit
+
+import numpy as np
+from PIL import Image
+
+
+# =========================================================
+# ⚙️ TRIAGE SETTINGS
+# Cheapest checks first: <img> attributes and URL, then
+# response headers, then decoded size / aspect ratio, then a
+# perceptual-hash blocklist of known logos.
+# =========================================================
+
+MIN_SIDE_PX = 24            # icons, spacers, tracking pixels
+MIN_IMAGE_BYTES = 1024      # 1x1 GIFs are ~43 bytes
+MAX_IMAGE_BYTES = 5 * 1024 * 1024
+MAX_ASPECT_RATIO = 20       # dividers and rules
+
+# Some CDNs serve images as octet-stream; anything else that is
+# not image/* (HTML error pages, redirects to login) is rejected
+ALLOWED_NON_IMAGE_TYPES = {"application/octet-stream", "binary/octet-stream"}
+
+# One 64-bit dHash (hex) per line; '#' starts a comment
+LOGO_HASH_BLOCKLIST = os.getenv("EMAIL_AGENT_LOGO_HASHES", "logo_hashes.txt")
+LOGO_HASH_MAX_DISTANCE = 4
+
+# Matched against the URL path only: hosts such as
+# static.linkedin.com or pixel-cdn.net also serve real content
+_TRACKING_END = r"(?:/|\.(?:gif|png|php|aspx?)|$)"
+ICON_URL_REGEX = re.compile(
+    rf"/(?:pixel|spacer|beacon|track(?:ing)?){_TRACKING_END}"
+    # "open" is a common word: only as the last segment, or
+    # before an opaque ID segment (/open/3f9a…)
+    r"|/open(?:\.(?:gif|png|php|aspx?))?$"
+    r"|/open/(?=[^/.]*\d)[\w=-]{16,}/?$"
+    r"|/(?:1x1|blank|transparent|clear)\.(?:gif|png)$"
+    r"|/icons?/|/favicon"
+    r"|/social/[^?#]*icon"
+    r"|/(?:facebook|twitter|linkedin|instagram|youtube|tiktok|x)"
+    r"(?:[-_](?:icon|logo|\d+))*\.(?:png|gif|jpe?g|svg)$",
+    re.I
+)
+
+# Skip reasons counted during this process
+TRIAGE_STATS = Counter()
+
+
+def _skip(reason: str) -> str:
+    TRIAGE_STATS[reason] += 1
+    return reason
+
+
+def _pixels(value) -> int | None:
+    if value is None:
+        return None
+    match = re.match(r"\s*(\d+)\s*(px)?\s*$", str(value))
+    return int(match.group(1)) if match else None
+
+
+# =========================================================
+# 🏷️ STAGE 1: <img> TAG (NO NETWORK)
+# =========================================================
+
+def triage_image_tag(image: dict) -> str | None:
+    """
+    Returns a skip reason, or None if the image should be fetched.
+    """
+    src = image.get("src") or ""
+
+    if src.startswith("data:"):
+        return _skip("data_uri")
+
+    if not src.startswith(("http://", "https://")):
+        return _skip("unsupported_scheme")
+
+    width = _pixels(image.get("width"))
+    height = _pixels(image.get("height"))
+    if (width is not None and width < MIN_SIDE_PX) or (
+        height is not None and height < MIN_SIDE_PX
+    ):
+        return _skip("tiny_attributes")
+
+    if ICON_URL_REGEX.search(urlsplit(src).path):
+        return _skip("icon_url")
+
+    return None
+
+
+# =========================================================
+# 📏 STAGE 2: RESPONSE HEADERS / BODY SIZE
+# =========================================================
+
+def triage_headers(headers) -> str | None:
+    """
+    Checks Content-Type and Content-Length before the body is read.
+    """
+    content_type = (
+        headers.get("Content-Type", "").split(";", 1)[0].strip().lower()
+    )
+    if (
+        content_type
+        and not content_type.startswith("image/")
+        and content_type not in ALLOWED_NON_IMAGE_TYPES
+    ):
+        return _skip("not_an_image")
+
+    content_length = headers.get("Content-Length")
+    if content_length and str(content_length).isdigit():
+        if int(content_length) < MIN_IMAGE_BYTES:
+            return _skip("too_few_bytes")
+        if int(content_length) > MAX_IMAGE_BYTES:
+            return _skip("too_many_bytes")
+
+    return None
+
+
+def triage_body_size(size: int) -> str | None:
+    # For bodies without (or with a lying) Content-Length
+    if size > MAX_IMAGE_BYTES:
+        return _skip("too_many_bytes")
+    return None
+
+
+# =========================================================
+# 🖼️ STAGE 3: DECODED IMAGE
+# =========================================================
+
+def dhash(img: Image.Image) -> int:
+    """64-bit difference hash of a PIL image."""
+    small = np.asarray(
+        img.convert("L").resize((9, 8), Image.Resampling.LANCZOS),
+        dtype=np.int16
+    )
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int("".join("1" if bit else "0" for bit in bits), 2)
+
+
+_logo_hashes = None
+
+
+def _load_logo_hashes() -> list[int]:
+    global _logo_hashes
+
+    if _logo_hashes is None:
+        _logo_hashes = []
+        if os.path.exists(LOGO_HASH_BLOCKLIST):
+            with open(LOGO_HASH_BLOCKLIST) as f:
+                for line in f:
+                    line = line.split("#", 1)[0].strip()
+                    if line:
+                        _logo_hashes.append(int(line, 16))
+
+    return _logo_hashes
+
+
+def triage_image_bytes(data: bytes) -> str | None:
+    """
+    Returns a skip reason for images that cannot carry readable
+    text, or None if the image should go to Tesseract.
+    """
+    if len(data) < MIN_IMAGE_BYTES:
+        return _skip("too_few_bytes")
+
+    try:
+        # Image.open only reads the header; size is free
+        img = Image.open(BytesIO(data))
+        width, height = img.size
+    except Exception:
+        return _skip("undecodable")
+
+    if min(width, height) < MIN_SIDE_PX:
+        return _skip("tiny_dimensions")
+
+    if max(width, height) / min(width, height) > MAX_ASPECT_RATIO:
+        return _skip("aspect_ratio")
+
+    logo_hashes = _load_logo_hashes()
+    if logo_hashes:
+        try:
+            image_hash = dhash(img)
+        except Exception:
+            return _skip("undecodable")
+
+        for logo_hash in logo_hashes:
+            if bin(image_hash ^ logo_hash).count("1") <= LOGO_HASH_MAX_DISTANCE:
+                return _skip("logo_hash")
+
+    return None
+
+
+def triage_summary() -> str:
+    if not TRIAGE_STATS:
+        return "no images skipped"
+    return " ".join(f"{reason}={count}" for reason, count in TRIAGE_STATS.most_common())
@@ -0,0 +1,50 @@
+# llm_cache.py
+
+import hashlib
+import os
+
+from disk_cache import DiskCache
+from prompts import FINAL_ANALYSIS_PROMPT
+
+
+# =========================================================
+# ⚙️ LLM RESPONSE CACHE SETTINGS
+# The free-tier quota is the hard bottleneck: an email that was
+# already analyzed (re-run after a crash, duplicate message) is
+# answered from disk.
+#
+# Key = model + prompt version + SHA-256 of the prompt. Editing
+# FINAL_ANALYSIS_PROMPT changes PROMPT_VERSION, which
+# invalidates every older entry; entries also expire after
+# LLM_CACHE_TTL_SECONDS.
+# =========================================================
+
+LLM_CACHE_MAX_BYTES = 128 * 1024 * 1024
+LLM_CACHE_TTL_SECONDS = float(
+    os.getenv("EMAIL_AGENT_LLM_CACHE_TTL", 30 * 24 * 3600)
+)
+
+PROMPT_VERSION = hashlib.sha256(
+    FINAL_ANALYSIS_PROMPT.encode("utf-8")
+).hexdigest()[:12]
+
+LLM_CACHE = DiskCache("llm", LLM_CACHE_MAX_BYTES)
+
+
+def llm_cache_key(model: str, prompt: str) -> str:
+    digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+    return f"{model}:{PROMPT_VERSION}:{digest}"
+
+
+def get_cached_analysis(model: str, prompt: str) -> dict | None:
+    """{"raw_response", "payload"} of an earlier call, or None."""
+    return LLM_CACHE.get(
+        llm_cache_key(model, prompt), max_age=LLM_CACHE_TTL_SECONDS
+    )
+
+
+def store_analysis(model: str, prompt: str, raw_response: str, payload: dict) -> None:
+    LLM_CACHE.set(
+        llm_cache_key(model, prompt),
+        {"raw_response": raw_response, "payload": payload}
+    )
@@ -0,0 +1,214 @@
+# llm_dispatcher.py
+
+import os
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+
+from LLM_Gemini import (
+    call_llm,
+    LLMQuotaExhausted,
+    LLMRateLimited,
+    LLMTransientError
+)
+from llm_usage import estimate_tokens
+from rate_limit import TokenBucket, backoff_delay
+
+
+# =========================================================
+# ⚙️ LLM BUDGET SETTINGS
+# Requests and tokens per minute are paced by token buckets
+# instead of a fixed sleep; a per-minute 429 halves the pace and
+# is retried with jittered backoff, a per-day quota stops the
+# run.
+# =========================================================
+
+LLM_RPM = float(os.getenv("EMAIL_AGENT_LLM_RPM", "10"))
+LLM_TPM = float(os.getenv("EMAIL_AGENT_LLM_TPM", "250000"))
+LLM_MAX_IN_FLIGHT = int(os.getenv("EMAIL_AGENT_LLM_MAX_IN_FLIGHT", "4"))
+
+LLM_MAX_RETRIES = 5
+LLM_BACKOFF_BASE_SECONDS = 2.0
+
+# =========================================================
+# 🚦 DISPATCHER
+# =========================================================
+
+class LLMDispatcher:
+    """
+    Calls `call(prompt, system_instruction=...)` (Gemini by
+    default) within an RPM / TPM
+    budget with at most max_in_flight calls at once.
+
+    - LLMRateLimited / LLMTransientError → retried with
+      exponential backoff + full jitter (a 429 also slows both
+      buckets down); a 429 that outlives max_retries is treated
+      as an exhausted quota
+    - LLMQuotaExhausted → every later call fails fast
+    """
+
+    def __init__(
+        self,
+        call=None,
+        rpm: float = LLM_RPM,
+        tpm: float = LLM_TPM,
+        max_in_flight: int = LLM_MAX_IN_FLIGHT,
+        max_retries: int = LLM_MAX_RETRIES,
+        backoff_base: float = LLM_BACKOFF_BASE_SECONDS
+    ):
+        self._call = call
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+
+        # capacity 1: requests are spaced evenly, never bursted
+        self.requests = TokenBucket(rate=rpm / 60, capacity=1)
+        self.tokens = TokenBucket(rate=tpm / 60, capacity=tpm / 4)
+
+        self._in_flight = threading.BoundedSemaphore(max_in_flight)
+        self._exhausted = False
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+        # calls / rate_limited / transient_errors / quota_stops
+        self.stats = Counter()
+
+    def call(self, prompt: str, system_instruction: str | None = None) -> str:
+        tokens = estimate_tokens(prompt)
+        if system_instruction:
+            tokens += estimate_tokens(system_instruction)
+
+        for attempt in range(self.max_retries + 1):
+            if self._exhausted:
+                raise LLMQuotaExhausted("Gemini quota exhausted earlier in this run.")
+
+            self.requests.acquire()
+            self.tokens.acquire(tokens)
+
+            try:
+                with self._in_flight:
+                    text = (self._call or call_llm)(
+                        prompt, system_instruction=system_instruction
+                    )
+
+                self.stats["calls"] += 1
+                self.requests.on_success()
+                self.tokens.on_success()
+                return text
+
+            except LLMQuotaExhausted:
+                self._exhausted = True
+                self.stats["quota_stops"] += 1
+                raise
+
+            except LLMRateLimited:
+                self.stats["rate_limited"] += 1
+                self.requests.on_throttle()
+                self.tokens.on_throttle()
+
+                if attempt == self.max_retries:
+                    self._exhausted = True
+                    self.stats["quota_stops"] += 1
+                    raise LLMQuotaExhausted(
+                        "Gemini kept rate limiting after retries. Resume later."
+                    )
+
+            except LLMTransientError:
+                self.stats["transient_errors"] += 1
+                if attempt == self.max_retries:
+                    raise
+
+            time.sleep(backoff_delay(attempt, base=self.backoff_base))
+
+    def map(self, fn, items) -> list:
+        """
+        [fn(item) ...] in order, on up to max_in_flight threads
+        (fn is expected to go through self.call).
+        """
+        items = list(items)
+        if len(items) <= 1:
+            return [fn(item) for item in items]
+
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(
+                    max_workers=self.max_in_flight,
+                    thread_name_prefix="llm-dispatch"
+                )
+
+        return [future.result() for future in [self._pool.submit(fn, item) for item in items]]
+
+    def summary(self) -> str:
+        return (
+            f"calls={self.stats['calls']} "
+            f"rate_limited={self.stats['rate_limited']} "
+            f"transient_errors={self.stats['transient_errors']} "
+            f"quota_stops={self.stats['quota_stops']}"
+        )
+
+
+LLM_DISPATCHER = LLMDispatcher()
+
+
+# =========================================================
+# 🧪 LOCAL FAKE (ENFORCES GEMINI-STYLE LIMITS)
+# =========================================================
+
+class FakeLLM:
+    """
+    Offline stand-in for call_llm: sliding 60 s RPM / TPM windows
+    raise LLMRateLimited, calls past daily_requests raise
+    LLMQuotaExhausted, and every call takes latency_ms. response
+    is the reply text, or a callable(prompt, system_instruction)
+    returning it.
+    """
+
+    def __init__(
+        self,
+        rpm: float,
+        tpm: float,
+        daily_requests: int = None,
+        latency_ms: float = 0,
+        response: str = '{"email_type": "IGNORE", "sender": null, "subject": null}'
+    ):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.daily_requests = daily_requests
+        self.latency_ms = latency_ms
+        self.response = response
+
+        self._window = deque()      # (timestamp, tokens)
+        self._lock = threading.Lock()
+        self.stats = Counter()
+
+    def __call__(self, prompt: str, system_instruction: str | None = None) -> str:
+        tokens = estimate_tokens(prompt)
+        if system_instruction:
+            tokens += estimate_tokens(system_instruction)
+
+        with self._lock:
+            now = time.monotonic()
+            while self._window and now - self._window[0][0] >= 60:
+                self._window.popleft()
+
+            if self.daily_requests is not None and self.stats["accepted"] >= self.daily_requests:
+                self.stats["rejected_daily"] += 1
+                raise LLMQuotaExhausted("fake: GenerateRequestsPerDay exhausted")
+
+            if (
+                len(self._window) >= self.rpm
+                or sum(t for _, t in self._window) + tokens > self.tpm
+            ):
+                self.stats["rejected_minute"] += 1
+                raise LLMRateLimited("fake: 429 RESOURCE_EXHAUSTED (per minute)")
+
+            self._window.append((now, tokens))
+            self.stats["accepted"] += 1
+
+        if self.latency_ms > 0:
+            time.sleep(self.latency_ms / 1000)
+
+        if callable(self.response):
+            return self.response(prompt, system_instruction)
+        return self.response
@@ -0,0 +1,95 @@
+# llm_usage.py
+
+import threading
+from collections import Counter, deque
+
+
+# =========================================================
+# ⚙️ TOKEN ACCOUNTING SETTINGS
+# Every Gemini call records input / output tokens (from the
+# response's usage_metadata) and latency. Input is split into
+# the static instructions (system instruction) and the email
+# content, so the report shows what the fixed prompt costs.
+# =========================================================
+
+CHARS_PER_TOKEN = 4             # rough local estimate
+MAX_CALL_RECORDS = 1000         # per-call records kept in memory
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+# calls / estimated_calls / input_tokens / instruction_tokens /
+# content_tokens / cached_tokens / output_tokens /
+# thinking_tokens / latency_ms
+LLM_USAGE = Counter()
+
+# One dict per call, newest last
+LLM_CALLS = deque(maxlen=MAX_CALL_RECORDS)
+
+_lock = threading.Lock()
+
+
+def record_call(
+    input_tokens: int,
+    output_tokens: int,
+    instruction_tokens: int = 0,
+    cached_tokens: int = 0,
+    thinking_tokens: int = 0,
+    latency_ms: float = 0.0,
+    estimated: bool = False
+) -> dict:
+    """
+    Records one call. estimated=True when the counts are local
+    estimates (replay mode, missing usage_metadata).
+    """
+    instruction_tokens = min(instruction_tokens, input_tokens)
+
+    call = {
+        "input_tokens": input_tokens,
+        "instruction_tokens": instruction_tokens,
+        "content_tokens": input_tokens - instruction_tokens,
+        "cached_tokens": cached_tokens,
+        "output_tokens": output_tokens,
+        "thinking_tokens": thinking_tokens,
+        "latency_ms": latency_ms,
+        "estimated": estimated
+    }
+
+    with _lock:
+        LLM_CALLS.append(call)
+        LLM_USAGE["calls"] += 1
+        LLM_USAGE["estimated_calls"] += estimated
+        for field in (
+            "input_tokens", "instruction_tokens", "content_tokens",
+            "cached_tokens", "output_tokens", "thinking_tokens", "latency_ms"
+        ):
+            LLM_USAGE[field] += call[field]
+
+    return call
+
+
+def usage_summary() -> str:
+    calls = LLM_USAGE["calls"]
+    if not calls:
+        return "calls=0"
+
+    input_tokens = max(1, LLM_USAGE["input_tokens"])
+    summary = (
+        f"calls={calls} "
+        f"input={LLM_USAGE['input_tokens']} "
+        f"(instructions={LLM_USAGE['instruction_tokens']} "
+        f"{LLM_USAGE['instruction_tokens'] / input_tokens:.0%}, "
+        f"email content={LLM_USAGE['content_tokens']} "
+        f"{LLM_USAGE['content_tokens'] / input_tokens:.0%}, "
+        f"served from cache={LLM_USAGE['cached_tokens']}) "
+        f"output={LLM_USAGE['output_tokens']} "
+        f"thinking={LLM_USAGE['thinking_tokens']} "
+        f"avg latency={LLM_USAGE['latency_ms'] / calls:.0f}ms"
+    )
+
+    if LLM_USAGE["estimated_calls"]:
+        summary += f" ({LLM_USAGE['estimated_calls']} calls estimated locally)"
+
+    return summary
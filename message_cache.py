@@ -0,0 +1,38 @@
+# message_cache.py
+
+from disk_cache import DiskCache
+from gmail_quota import execute_with_backoff
+
+
+# =========================================================
+# ⚙️ RAW MESSAGE CACHE SETTINGS
+# format="full" payloads never change once delivered, so they
+# are kept locally and re-runs skip the Gmail round trip.
+# ~512 MB holds tens of thousands of compressed messages.
+# =========================================================
+
+MESSAGE_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+MESSAGE_CACHE = DiskCache("messages", MESSAGE_CACHE_MAX_BYTES)
+
+
+def fetch_full_message(service, message_id: str) -> dict:
+    """
+    Returns the format="full" message, from the local cache when
+    present, otherwise from Gmail (and stores it).
+    """
+    msg = MESSAGE_CACHE.get(message_id)
+    if msg is not None:
+        return msg
+
+    msg = execute_with_backoff(
+        service.users().messages().get(
+            userId="me",
+            id=message_id,
+            format="full"
+        ),
+        "messages.get"
+    )
+
+    MESSAGE_CACHE.set(message_id, msg)
+    return msg
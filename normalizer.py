@@ -0,0 +1,51 @@
+# normalizer.py
+
+import html
+import re
+
+
+# =========================================================
+# NORMALIZATION (FUSED)
+# Junk chars and whitespace runs are rewritten by two C-level
+# substitutions that only match what actually changes,
+# then a single pass over the lines strips them and drops
+# blanks and consecutive duplicates. Output is identical to the
+# previous unescape → sub ×4 → split → dedupe chain.
+# =========================================================
+
+JUNK_CHARS_REGEX = re.compile(r"[\ufeff\u2007\u200b\u200c\u200d\xa0\u034f]")
+
+# Same result as [ \t]+ → " ", but single spaces are left alone
+SPACE_RUN_REGEX = re.compile(r"\t[ \t]*| [ \t]+")
+
+
+def _normalize(text: str, by_line: bool) -> str:
+    if not text:
+        return ""
+
+    text = html.unescape(text)
+    text = JUNK_CHARS_REGEX.sub(" ", text)
+    text = SPACE_RUN_REGEX.sub(" ", text)
+
+    if not by_line:
+        return text.strip()
+
+    # "\r\n" and blank-line runs need no separate pass: a trailing
+    # "\r" is removed by strip() and empty lines are skipped
+    cleaned_lines = []
+    prev = None
+    for line in text.split("\n"):
+        line = line.strip()
+        if line and line != prev:
+            cleaned_lines.append(line)
+            prev = line
+
+    return "\n".join(cleaned_lines)
+
+
+def normalize_text(text: str) -> str:
+    return _normalize(text, by_line=True)
+
+
+def normalize_ocr_text(text: str) -> str:
+    return _normalize(text, by_line=False)
@@ -0,0 +1,411 @@
+# ocr.py
+
+import hashlib
+import math
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import (
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait
+)
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+
+import numpy as np
+import pytesseract
+from PIL import Image
+
+from disk_cache import DiskCache
+from image_download import download_image
+from image_preprocess import preprocess_for_ocr
+from image_triage import triage_image_tag, triage_image_bytes
+from normalizer import normalize_ocr_text
+
+
+# =========================================================
+# ⚙️ OCR SETTINGS
+# Downloads are I/O bound → threads.
+# Tesseract is CPU bound → a process pool, whose size is the
+# global cap on concurrent OCR batches across all emails.
+# =========================================================
+
+OCR_MAX_PROCESSES = max(1, (os.cpu_count() or 2) - 1)
+DOWNLOAD_WORKERS = 16
+
+TESSERACT_TIMEOUT_SECONDS = 3
+
+# Images per tesseract invocation (one process start and model
+# load per batch instead of per image)
+OCR_BATCH_SIZE = 8
+PAGE_SEPARATOR = "@@EMAIL_AGENT_PAGE@@"
+
+# Resize / binarize / crop before Tesseract (see image_preprocess)
+OCR_PREPROCESS = True
+
+# Hard limit for all images of one email
+OCR_EMAIL_DEADLINE_SECONDS = 15
+
+# Logos, banners and signatures repeat across hundreds of mails:
+# results (including "no text") are cached by URL and by the
+# SHA-256 of the downloaded bytes
+OCR_CACHE_MAX_BYTES = 64 * 1024 * 1024
+OCR_CACHE = DiskCache("ocr", OCR_CACHE_MAX_BYTES)
+
+# url_hits / content_hits / ocr_runs / skipped / failures /
+# pool_recycles
+OCR_STATS = Counter()
+
+
+# =========================================================
+# 🖼️ TESSERACT (RUNS IN WORKER PROCESSES)
+# =========================================================
+
+def _prepare(data: bytes) -> Image.Image | None:
+    """
+    Decodes and preprocesses an image; None means it has no
+    text-like regions and Tesseract can be skipped.
+    """
+    img = Image.open(BytesIO(data))
+    if OCR_PREPROCESS:
+        return preprocess_for_ocr(img)
+    return img.convert("L")
+
+
+def _remaining(deadline: float | None) -> float:
+    """Seconds left until a time.time() deadline (inf for None)."""
+    return math.inf if deadline is None else deadline - time.time()
+
+
+def ocr_image_bytes(data: bytes, deadline: float | None = None) -> str | None:
+    """
+    Returns "" when the image has no text and None when OCR
+    itself failed (e.g. timeout, or `deadline` — a time.time()
+    timestamp — already passed).
+    """
+    try:
+        # ⏱️ Limit OCR time (never past the deadline)
+        timeout = min(TESSERACT_TIMEOUT_SECONDS, _remaining(deadline))
+        if timeout <= 0:
+            return None
+
+        img = _prepare(data)
+        if img is None:
+            return ""
+
+        text = pytesseract.image_to_string(
+            np.array(img),
+            timeout=timeout
+        )
+        return normalize_ocr_text(text)
+
+    except Exception:
+        return None
+
+
+def _split_pages(output: str, count: int) -> list[str] | None:
+    pages = output.split(PAGE_SEPARATOR)
+
+    # Older Tesseract writes the separator after every page,
+    # newer ones only between pages
+    if len(pages) == count + 1 and not pages[-1].strip():
+        pages = pages[:-1]
+
+    return pages if len(pages) == count else None
+
+
+def ocr_image_batch(images: list[bytes], deadline: float | None = None) -> list[str | None]:
+    """
+    OCRs several images with ONE tesseract process (an image list
+    file), so process start-up and model load are paid once.
+
+    The batch gets TESSERACT_TIMEOUT_SECONDS per image, capped by
+    `deadline` (a time.time() timestamp, e.g. the email's OCR
+    deadline). If it times out (one slow image is enough) or its
+    output cannot be split back per image, each image is retried
+    on its own with the per-image timeout, until the deadline;
+    images not reached yield None. Images the preprocessing finds
+    no text in are answered "" without OCR.
+    """
+    if len(images) == 1:
+        return [ocr_image_bytes(images[0], deadline)]
+
+    if _remaining(deadline) <= 0:
+        return [None] * len(images)
+
+    with tempfile.TemporaryDirectory(prefix="ocr_batch_") as tmp:
+        # path per image; "" = no text-like regions, None = undecodable
+        paths = []
+        for index, data in enumerate(images):
+            try:
+                img = _prepare(data)
+                if img is None:
+                    paths.append("")
+                    continue
+
+                path = os.path.join(tmp, f"{index}.png")
+                img.save(path)
+                paths.append(path)
+            except Exception:
+                paths.append(None)
+
+        valid_paths = [path for path in paths if path]
+        if not valid_paths:
+            return ["" if path == "" else None for path in paths]
+
+        list_path = os.path.join(tmp, "images.txt")
+        with open(list_path, "w") as f:
+            f.write("\n".join(valid_paths) + "\n")
+
+        try:
+            output = pytesseract.image_to_string(
+                list_path,
+                config=f"-c page_separator={PAGE_SEPARATOR}",
+                timeout=min(
+                    TESSERACT_TIMEOUT_SECONDS * len(valid_paths),
+                    _remaining(deadline)
+                )
+            )
+            pages = _split_pages(output, len(valid_paths))
+
+        except Exception:
+            # Includes pytesseract's timeout RuntimeError
+            pages = None
+
+    if pages is None:
+        # ocr_image_bytes returns None at once past the deadline
+        return [
+            ocr_image_bytes(data, deadline) if path else path
+            for data, path in zip(images, paths)
+        ]
+
+    page_iter = iter(pages)
+    return [
+        normalize_ocr_text(next(page_iter)) if path else path
+        for path in paths
+    ]
+
+
+def ocr_image_from_url(url):
+    data, _ = download_image(url)
+    return (ocr_image_bytes(data) or "") if data else ""
+
+
+# =========================================================
+# 🧵 POOLS (SHARED BY ALL EMAILS)
+# =========================================================
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _get_pool(kind: str):
+    with _pools_lock:
+        if kind not in _pools:
+            if kind == "process":
+                # spawn: forking a process that already runs threads
+                # is unsafe
+                _pools[kind] = ProcessPoolExecutor(
+                    max_workers=OCR_MAX_PROCESSES,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+            else:
+                _pools[kind] = ThreadPoolExecutor(
+                    max_workers=DOWNLOAD_WORKERS,
+                    thread_name_prefix="ocr-download"
+                )
+        return _pools[kind]
+
+
+def _reset_process_pool() -> None:
+    """
+    Stops the process pool; the next submit starts a fresh one.
+
+    A running batch cannot be cancelled, so its worker is
+    terminated, and the lock is held until every old worker has
+    exited: a fresh pool never runs next to the old one, and
+    OCR_MAX_PROCESSES stays the global cap. Batches of other
+    emails still on the old pool fail (None → "").
+    """
+    with _pools_lock:
+        pool = _pools.pop("process", None)
+        if pool is None:
+            return
+
+        for process in list((pool._processes or {}).values()):
+            process.terminate()
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def _remember(url: str, content_key: str, text: str) -> None:
+    entry = {"text": text}
+    OCR_CACHE.set(content_key, entry)
+    OCR_CACHE.set(f"url:{url}", entry)
+
+
+def _resolve(url: str) -> tuple[str | None, bytes | None, str | None]:
+    """
+    Cache lookups, download and triage for one image.
+
+    Returns (text, None, None) when resolved without Tesseract,
+    or (None, data, content_key) when the image needs OCR.
+    """
+    cached = OCR_CACHE.get(f"url:{url}")
+    if cached is not None:
+        OCR_STATS["url_hits"] += 1
+        return cached["text"], None, None
+
+    data, reason = download_image(url)
+    if reason:
+        OCR_STATS["skipped"] += 1
+        return "", None, None
+
+    if not data:
+        OCR_STATS["failures"] += 1
+        return "", None, None
+
+    content_key = f"sha256:{hashlib.sha256(data).hexdigest()}"
+    cached = OCR_CACHE.get(content_key)
+    if cached is not None:
+        OCR_STATS["content_hits"] += 1
+        OCR_CACHE.set(f"url:{url}", cached)
+        return cached["text"], None, None
+
+    # Pixels, icons, dividers, known logos: remembered as "no text"
+    if triage_image_bytes(data):
+        OCR_STATS["skipped"] += 1
+        _remember(url, content_key, "")
+        return "", None, None
+
+    return None, data, content_key
+
+
+# =========================================================
+# 🚀 ALL IMAGES OF ONE EMAIL
+# =========================================================
+
+def ocr_images(
+    images: list[dict],
+    deadline_seconds: float = OCR_EMAIL_DEADLINE_SECONDS
+) -> list[str]:
+    """
+    OCRs the <img> tags ({"src", "width", "height"}) of one email
+    and returns their texts in the same order.
+
+    Downloads run in parallel threads; the images left after
+    caching and triage are OCRed in batches spread over the
+    process pool. Images skipped, failing, or not finished by
+    the deadline yield "".
+    """
+    texts = [""] * len(images)
+    if not images:
+        return texts
+
+    deadline = time.monotonic() + deadline_seconds
+    # The same deadline for the worker processes (time.time()
+    # is comparable across processes)
+    batch_deadline = time.time() + deadline_seconds
+    thread_pool = _get_pool("thread")
+
+    resolving = {}
+    for index, image in enumerate(images):
+        if triage_image_tag(image):
+            OCR_STATS["skipped"] += 1
+        else:
+            resolving[index] = thread_pool.submit(_resolve, image["src"])
+
+    done, not_done = wait(list(resolving.values()), timeout=deadline_seconds)
+    for future in not_done:
+        future.cancel()
+
+    # content_key → [(index, url)]; identical images are OCRed once
+    to_ocr = {}
+    image_data = {}
+    for index, future in resolving.items():
+        if future not in done:
+            OCR_STATS["failures"] += 1
+            continue
+
+        text, data, content_key = future.result()
+        if data is None:
+            texts[index] = text
+        else:
+            to_ocr.setdefault(content_key, []).append((index, images[index]["src"]))
+            image_data[content_key] = data
+
+    if not to_ocr:
+        return texts
+
+    # Batch, but keep enough batches to use every worker process
+    keys = list(to_ocr)
+    batch_size = min(
+        OCR_BATCH_SIZE, max(1, math.ceil(len(keys) / OCR_MAX_PROCESSES))
+    )
+    batches = []
+    for start in range(0, len(keys), batch_size):
+        batch = keys[start:start + batch_size]
+        try:
+            future = _get_pool("process").submit(
+                ocr_image_batch, [image_data[key] for key in batch], batch_deadline
+            )
+        except BrokenProcessPool:
+            # A worker died (e.g. OOM); start a fresh pool next time
+            _reset_process_pool()
+            future = None
+        batches.append((batch, future))
+
+    recycle_pool = False
+    for batch, future in batches:
+        if future is None:
+            results = [None] * len(batch)
+        else:
+            try:
+                results = future.result(
+                    timeout=max(0, deadline - time.monotonic())
+                )
+            except Exception as e:
+                if isinstance(e, BrokenProcessPool):
+                    recycle_pool = True
+                # A batch already running cannot be cancelled and
+                # keeps its worker busy
+                elif not future.cancel() and not future.done():
+                    recycle_pool = True
+                results = [None] * len(batch)
+
+        for content_key, text in zip(batch, results):
+            # Failures are not cached; "no text" results are
+            if text is None:
+                OCR_STATS["failures"] += 1
+                continue
+
+            OCR_STATS["ocr_runs"] += 1
+            for index, url in to_ocr[content_key]:
+                texts[index] = text
+                _remember(url, content_key, text)
+
+    # Broken, or workers still busy past the deadline: their
+    # workers are stopped and later emails get a fresh pool
+    if recycle_pool:
+        OCR_STATS["pool_recycles"] += 1
+        _reset_process_pool()
+
+    return texts
+
+
+def ocr_cache_summary() -> str:
+    hits = OCR_STATS["url_hits"] + OCR_STATS["content_hits"]
+    lookups = hits + OCR_STATS["ocr_runs"]
+    hit_rate = hits / lookups if lookups else 0.0
+
+    return (
+        f"url_hits={OCR_STATS['url_hits']} "
+        f"content_hits={OCR_STATS['content_hits']} "
+        f"ocr_runs={OCR_STATS['ocr_runs']} "
+        f"skipped={OCR_STATS['skipped']} "
+        f"failures={OCR_STATS['failures']} "
+        f"pool_recycles={OCR_STATS['pool_recycles']} hit_rate={hit_rate:.0%}"
+    )
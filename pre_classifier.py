@@ -0,0 +1,361 @@
+# pre_classifier.py
+#
+# Local email_type classifier trained on the labels Gemini
+# already produced (emails.email_type).
+# Usage: python pre_classifier.py train | evaluate
+
+import os
+import re
+import sys
+import zlib
+
+import numpy as np
+
+from disk_cache import CACHE_DIR
+
+
+# =========================================================
+# ⚙️ MODEL SETTINGS
+# Hashed unigram + bigram features (crc32), softmax logistic
+# regression trained with full-batch gradient descent, then
+# temperature-scaled on a held-out split so probabilities are
+# calibrated.
+# =========================================================
+
+LABELS = ["IGNORE", "JOB_PIPELINE", "LINKEDIN_NETWORKING"]
+
+MODEL_PATH = os.getenv(
+    "EMAIL_AGENT_PRECLASSIFIER", os.path.join(CACHE_DIR, "pre_classifier.npz")
+)
+
+HASH_FEATURES = 2 ** 18
+MAX_TOKENS = 2000           # head of the email is enough
+
+EPOCHS = 300
+LEARNING_RATE = 0.5
+L2 = 1e-4
+
+HOLDOUT_SHARE = 0.2
+SEED = 20
+
+# T ≥ 1 only: on a small or separable calibration split the NLL
+# keeps falling as T shrinks, and a T < 1 fit would sharpen
+# probabilities past SKIP_THRESHOLD. Below MIN_CALIBRATION_SAMPLES
+# the temperature stays at 1.0.
+TEMPERATURE_GRID = np.logspace(0, 1, 41)
+MIN_CALIBRATION_SAMPLES = 50
+
+# Only a confident IGNORE skips Gemini; the other types need the
+# LLM's extraction anyway
+SKIP_LABEL = "IGNORE"
+SKIP_THRESHOLD = 0.97
+
+TOKEN_REGEX = re.compile(r"[a-z0-9]+")
+
+
+# =========================================================
+# 🔢 FEATURES
+# =========================================================
+
+def _hash(feature: str) -> int:
+    return zlib.crc32(feature.encode("utf-8")) % HASH_FEATURES
+
+
+def featurize(text: str) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Returns (feature indices, values): log counts of hashed
+    unigrams and bigrams, L2-normalized.
+    """
+    tokens = TOKEN_REGEX.findall((text or "").lower())[:MAX_TOKENS]
+    features = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+
+    if not features:
+        return np.zeros(0, dtype=np.int64), np.zeros(0)
+
+    indices, counts = np.unique(
+        np.fromiter(map(_hash, features), dtype=np.int64, count=len(features)),
+        return_counts=True
+    )
+    values = np.log1p(counts)
+    return indices, values / np.linalg.norm(values)
+
+
+def _stack(texts) -> tuple[np.ndarray, np.ndarray, np.ndarray, int]:
+    """Sparse batch as flat (row, feature, value) arrays."""
+    rows, columns, values = [], [], []
+    count = 0
+
+    for row, text in enumerate(texts):
+        indices, weights = featurize(text)
+        rows.append(np.full(len(indices), row))
+        columns.append(indices)
+        values.append(weights)
+        count += 1
+
+    if not count:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0), 0
+
+    return np.concatenate(rows), np.concatenate(columns), np.concatenate(values), count
+
+
+# =========================================================
+# 🧮 SOFTMAX REGRESSION (SPARSE, NUMPY)
+# =========================================================
+
+def _logits(weights, bias, batch) -> np.ndarray:
+    rows, columns, values, count = batch
+    logits = np.empty((count, len(LABELS)))
+
+    for label in range(len(LABELS)):
+        logits[:, label] = np.bincount(
+            rows, weights=weights[columns, label] * values, minlength=count
+        )
+
+    return logits + bias
+
+
+def _softmax(logits: np.ndarray) -> np.ndarray:
+    logits = logits - logits.max(axis=1, keepdims=True)
+    exp = np.exp(logits)
+    return exp / exp.sum(axis=1, keepdims=True)
+
+
+def _fit(batch, targets: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    rows, columns, values, count = batch
+    weights = np.zeros((HASH_FEATURES, len(LABELS)))
+    bias = np.zeros(len(LABELS))
+
+    # Classes are imbalanced (mostly IGNORE): weight by inverse
+    # frequency
+    frequency = np.bincount(targets, minlength=len(LABELS))
+    sample_weights = (count / (len(LABELS) * np.maximum(frequency, 1)))[targets]
+
+    onehot = np.eye(len(LABELS))[targets]
+
+    for _ in range(EPOCHS):
+        error = (_softmax(_logits(weights, bias, batch)) - onehot)
+        error *= (sample_weights / count)[:, None]
+
+        gradient = np.empty_like(weights)
+        for label in range(len(LABELS)):
+            gradient[:, label] = np.bincount(
+                columns, weights=values * error[rows, label], minlength=HASH_FEATURES
+            )
+
+        weights -= LEARNING_RATE * (gradient + L2 * weights)
+        bias -= LEARNING_RATE * error.sum(axis=0)
+
+    return weights, bias
+
+
+def _fit_temperature(logits: np.ndarray, targets: np.ndarray) -> float:
+    """
+    Temperature in TEMPERATURE_GRID minimizing the held-out
+    negative log-likelihood; 1.0 with too few samples.
+    """
+    if len(targets) < MIN_CALIBRATION_SAMPLES:
+        return 1.0
+
+    best_temperature, best_nll = 1.0, np.inf
+
+    for temperature in TEMPERATURE_GRID:
+        probs = _softmax(logits / temperature)
+        nll = -np.log(probs[np.arange(len(targets)), targets] + 1e-12).mean()
+        if nll < best_nll:
+            best_temperature, best_nll = float(temperature), nll
+
+    return best_temperature
+
+
+# =========================================================
+# 🗂️ TRAINING DATA (emails TABLE)
+# =========================================================
+
+def _split(texts: list[str], labels: list[str]):
+    order = np.random.default_rng(SEED).permutation(len(texts))
+    holdout = max(1, int(len(texts) * HOLDOUT_SHARE))
+
+    test, train = order[:holdout], order[holdout:]
+    targets = np.array([LABELS.index(label) for label in labels])
+
+    return (
+        [texts[i] for i in train], targets[train],
+        [texts[i] for i in test], targets[test]
+    )
+
+
+def _load_training_data() -> tuple[list[str], list[str]]:
+    from db_Persistor import load_labeled_emails
+
+    rows = load_labeled_emails(LABELS)
+    return [text for text, _ in rows], [label for _, label in rows]
+
+
+# =========================================================
+# 🔮 PREDICTION
+# =========================================================
+
+class PreClassifier:
+    def __init__(self, weights, bias, temperature: float):
+        self.weights = weights
+        self.bias = bias
+        self.temperature = temperature
+
+    def predict_proba(self, texts) -> np.ndarray:
+        logits = _logits(self.weights, self.bias, _stack(texts))
+        return _softmax(logits / self.temperature)
+
+    def predict(self, text: str) -> tuple[str, float]:
+        probs = self.predict_proba([text])[0]
+        best = int(np.argmax(probs))
+        return LABELS[best], float(probs[best])
+
+    def save(self, path: str = MODEL_PATH) -> None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        np.savez_compressed(
+            path,
+            weights=self.weights.astype(np.float32),
+            bias=self.bias,
+            temperature=self.temperature,
+            labels=np.array(LABELS)
+        )
+
+    @classmethod
+    def load(cls, path: str = MODEL_PATH):
+        with np.load(path) as data:
+            if list(data["labels"]) != LABELS:
+                raise ValueError("pre-classifier was trained with other labels")
+            return cls(data["weights"], data["bias"], float(data["temperature"]))
+
+
+def train(texts: list[str], targets: np.ndarray, calib_texts, calib_targets) -> PreClassifier:
+    weights, bias = _fit(_stack(texts), targets)
+    model = PreClassifier(weights, bias, 1.0)
+
+    if len(calib_targets) < MIN_CALIBRATION_SAMPLES:
+        print(
+            f"⚠️ {len(calib_targets)} calibration emails "
+            f"(< {MIN_CALIBRATION_SAMPLES}) → temperature left at 1.0"
+        )
+
+    calib_logits = _logits(weights, bias, _stack(calib_texts))
+    model.temperature = _fit_temperature(calib_logits, calib_targets)
+    return model
+
+
+_model = None
+_model_loaded = False
+
+
+def get_model() -> PreClassifier | None:
+    """The saved model, or None until `train` has been run."""
+    global _model, _model_loaded
+
+    if not _model_loaded:
+        _model_loaded = True
+        if os.path.exists(MODEL_PATH):
+            try:
+                _model = PreClassifier.load(MODEL_PATH)
+            except Exception as e:
+                print(f"⚠️ Pre-classifier not loaded → {e}")
+
+    return _model
+
+
+def should_skip_llm(text: str) -> tuple[bool, str | None, float]:
+    """
+    (skip, predicted label, probability). Only a calibrated
+    IGNORE probability ≥ SKIP_THRESHOLD skips Gemini.
+    """
+    model = get_model()
+    if model is None:
+        return False, None, 0.0
+
+    label, probability = model.predict(text)
+    return label == SKIP_LABEL and probability >= SKIP_THRESHOLD, label, probability
+
+
+# =========================================================
+# 📊 OFFLINE EVALUATION
+# =========================================================
+
+def report(model: PreClassifier, texts: list[str], targets: np.ndarray) -> None:
+    probs = model.predict_proba(texts)
+    predicted = probs.argmax(axis=1)
+    confidence = probs.max(axis=1)
+
+    print(f"  held-out emails: {len(targets)} | temperature: {model.temperature:.2f}")
+
+    # T = 1.0 is the expected result for a model that is already
+    # calibrated (or underconfident); at the upper edge the NLL
+    # minimum lies past the grid and probabilities stay overconfident
+    if np.isclose(model.temperature, TEMPERATURE_GRID[-1]):
+        print(
+            f"  ⚠️ temperature at the grid's upper edge ({TEMPERATURE_GRID[-1]:.1f}): "
+            f"the model is more overconfident than the grid can correct, "
+            f"check precision before trusting p ≥ {SKIP_THRESHOLD}"
+        )
+    print(f"  accuracy: {(predicted == targets).mean():.1%}")
+
+    for index, label in enumerate(LABELS):
+        true_positive = np.sum((predicted == index) & (targets == index))
+        precision = true_positive / max(1, np.sum(predicted == index))
+        recall = true_positive / max(1, np.sum(targets == index))
+        print(
+            f"  {label:<20} precision {precision:6.1%} | recall {recall:6.1%} | "
+            f"support {np.sum(targets == index)}"
+        )
+
+    skip_index = LABELS.index(SKIP_LABEL)
+    skipped = (predicted == skip_index) & (confidence >= SKIP_THRESHOLD)
+    wrongly_skipped = np.sum(skipped & (targets != skip_index))
+
+    print(
+        f"  LLM calls avoided at p ≥ {SKIP_THRESHOLD}: "
+        f"{skipped.mean():.1%} ({skipped.sum()}/{len(targets)}) | "
+        f"non-IGNORE emails skipped: {wrongly_skipped}"
+    )
+
+
+# =========================================================
+# 🚀 ENTRY POINT
+# =========================================================
+
+def main():
+    command = sys.argv[1] if len(sys.argv) > 1 else "evaluate"
+
+    texts, labels = _load_training_data()
+    print(f"🗂️ {len(texts)} labeled emails")
+    if len(set(labels)) < 2:
+        print("⚠️ Need at least two email types to train")
+        return
+
+    train_texts, train_targets, test_texts, test_targets = _split(texts, labels)
+
+    if command == "evaluate":
+        # Calibrate on the held-out split's first half, report on
+        # the second, so the report is not on calibration data
+        half = max(1, len(test_texts) // 2)
+        if half == len(test_texts):
+            print("⚠️ Too few emails for a separate report split")
+            return
+
+        model = train(
+            train_texts, train_targets, test_texts[:half], test_targets[:half]
+        )
+        report(model, test_texts[half:], test_targets[half:])
+
+    elif command == "train":
+        # Held-out split only calibrates the temperature here
+        model = train(train_texts, train_targets, test_texts, test_targets)
+        model.save()
+        print(f"💾 Saved to {MODEL_PATH}")
+        print("  (report below is on the calibration split)")
+        report(model, test_texts, test_targets)
+
+    else:
+        print(f"Unknown command '{command}' (train | evaluate)")
+
+
+if __name__ == "__main__":
+    main()
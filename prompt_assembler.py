@@ -0,0 +1,287 @@
+# prompt_assembler.py
+
+import os
+import re
+from collections import Counter
+
+from inbox import SECTION_LABELS, render_sections, score_many
+from llm_usage import CHARS_PER_TOKEN, estimate_tokens
+
+
+# =========================================================
+# ⚙️ PROMPT BUDGET SETTINGS
+# A newsletter-sized email (long OCR, link lists, legal footer)
+# used to go to Gemini whole. Over PROMPT_TOKEN_BUDGET the email
+# is cut into chunks of lines and the lowest-value chunks are
+# dropped first: footer, then OCR, then body, each by job-keyword
+# density (score_many / tokens). The header, the first body
+# chunk and short key-field lines (Location:, CTC:, dates, ...)
+# are always kept. raw_text (persisted) stays complete.
+# =========================================================
+
+PROMPT_TOKEN_BUDGET = int(os.getenv("EMAIL_AGENT_PROMPT_TOKEN_BUDGET", "2500"))
+
+CHUNK_TOKENS = 120              # lines are grouped up to this size
+
+# Never squeezed below this, whatever reserved_tokens takes
+MIN_CONTENT_TOKENS = 2 * CHUNK_TOKENS
+
+# Key fields carry no job keyword (score_many gives them 0), so
+# a line that looks like one is pinned: "Location: Pune",
+# "CTC - 12 LPA", "Apply by 15 April", "on 03/04/2026" ...
+_MONTH = (
+    r"(?:jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|june?|july?"
+    r"|aug(?:ust)?|sep(?:t(?:ember)?)?|oct(?:ober)?|nov(?:ember)?|dec(?:ember)?)"
+)
+KEY_FIELD_REGEX = re.compile(
+    r"^\W*(?:location|venue|ctc|salary|compensation|stipend|package|pay"
+    r"|deadline|last date|apply by|due|date|when|time"
+    r"|experience|eligibility|notice period)\b[^:\-–\n]{0,20}[:\-–]"
+    rf"|\b\d{{1,2}}(?:st|nd|rd|th)?\s+{_MONTH}\b"
+    rf"|\b{_MONTH}\.?\s+\d{{1,2}}\b"
+    r"|\b\d{1,2}[/.-]\d{1,2}[/.-]\d{2,4}\b|\b\d{4}-\d{2}-\d{2}\b",
+    re.I
+)
+KEY_LINE_MAX_CHARS = 160        # longer lines are prose, not fields
+MAX_KEY_LINES = 12              # pinned per section
+
+# Footer starts at the first matching line in the last
+# FOOTER_ZONE of the body
+FOOTER_ZONE = 0.4
+FOOTER_REGEX = re.compile(
+    r"unsubscribe|opt[ -]out|manage (?:your )?(?:email |notification )?(?:preferences|settings)"
+    r"|privacy policy|terms of (?:service|use)|all rights reserved|©|\(c\) \d{4}"
+    r"|you (?:are receiving|received) this|no longer wish|view (?:this email )?in (?:your )?browser"
+    r"|sent to [^\s@]+@|this email was sent",
+    re.I
+)
+
+# Dropped first → last
+DROP_ORDER = {"footer": 0, "ocr": 1, "body": 2}
+
+TRIM_MARKER = "[... trimmed ...]"
+TRIM_MARKER_TOKENS = estimate_tokens(TRIM_MARKER)
+
+# emails / trimmed / tokens_in / tokens_out / cut_<kind>_tokens
+PROMPT_STATS = Counter()
+
+
+# =========================================================
+# ✂️ CHUNKING
+# =========================================================
+
+def is_key_line(line: str) -> bool:
+    return len(line) <= KEY_LINE_MAX_CHARS and bool(KEY_FIELD_REGEX.search(line))
+
+
+def _chunk_lines(lines: list[str], pin_keys: bool = False) -> list[tuple[list[str], bool]]:
+    """
+    (lines, pinned) chunks. With pin_keys, each key-field line
+    (up to MAX_KEY_LINES) becomes a pinned chunk of its own.
+    """
+    chunks, current, tokens = [], [], 0
+    pins_left = MAX_KEY_LINES if pin_keys else 0
+
+    for line in lines:
+        if pins_left and is_key_line(line):
+            if current:
+                chunks.append((current, False))
+                current, tokens = [], 0
+            chunks.append(([line], True))
+            pins_left -= 1
+            continue
+
+        current.append(line)
+        tokens += estimate_tokens(line)
+        if tokens >= CHUNK_TOKENS:
+            chunks.append((current, False))
+            current, tokens = [], 0
+
+    if current:
+        chunks.append((current, False))
+
+    return chunks
+
+
+def _footer_start(lines: list[str]) -> int:
+    """Index of the first footer line, or len(lines)."""
+    zone_start = int(len(lines) * (1 - FOOTER_ZONE))
+
+    for index in range(zone_start, len(lines)):
+        if FOOTER_REGEX.search(lines[index]):
+            return index
+
+    return len(lines)
+
+
+def split_chunks(sections) -> list[dict]:
+    """
+    [{"section", "kind", "lines", "tokens", "protected"}] in
+    prompt order; kind is header / ocr / body / footer. Key-field
+    lines outside the footer are protected chunks of one line.
+    """
+    chunks = []
+
+    for section, (kind, text) in enumerate(sections):
+        if kind == "header":
+            chunks.append({"section": section, "kind": kind, "lines": [text]})
+            continue
+
+        lines = text.split("\n")
+        footer_start = _footer_start(lines) if kind == "body" else len(lines)
+
+        for position, (chunk, pinned) in enumerate(
+            _chunk_lines(lines[:footer_start], pin_keys=True)
+        ):
+            chunks.append({
+                "section": section,
+                "kind": kind,
+                "lines": chunk,
+                "protected": pinned or (kind == "body" and position == 0)
+            })
+
+        for chunk, _ in _chunk_lines(lines[footer_start:]):
+            chunks.append({"section": section, "kind": "footer", "lines": chunk})
+
+    for chunk in chunks:
+        chunk["tokens"] = estimate_tokens("\n".join(chunk["lines"]))
+        chunk.setdefault("protected", chunk["kind"] == "header")
+
+    return chunks
+
+
+# =========================================================
+# 📐 ASSEMBLY
+# =========================================================
+
+def _render_kept(sections, chunks, kept: set) -> str:
+    kept_sections = []
+
+    for section, (kind, _) in enumerate(sections):
+        lines, trimmed = [], False
+
+        for index, chunk in enumerate(chunks):
+            if chunk["section"] != section:
+                continue
+            if index in kept:
+                lines.extend(chunk["lines"])
+                trimmed = False
+            elif not trimmed:
+                lines.append(TRIM_MARKER)
+                trimmed = True
+
+        # A section with nothing kept disappears, label included
+        if any(line != TRIM_MARKER for line in lines):
+            kept_sections.append((kind, "\n".join(lines)))
+
+    return render_sections(kept_sections)
+
+
+def assemble_prompt(
+    sections,
+    budget: int = PROMPT_TOKEN_BUDGET,
+    reserved_tokens: int = 0
+) -> tuple[str, list[dict]]:
+    """
+    (prompt_text, cuts) for the (kind, text) sections of
+    clean_email_from_message. reserved_tokens is text sent in
+    the same prompt (prior thread state) and comes out of the
+    budget. Under budget the prompt is raw_text unchanged; cuts
+    lists every dropped chunk ({"kind", "tokens", "score"}).
+    """
+    budget = max(budget - reserved_tokens, MIN_CONTENT_TOKENS)
+    raw_text = render_sections(sections)
+    raw_tokens = estimate_tokens(raw_text)
+
+    PROMPT_STATS["emails"] += 1
+    PROMPT_STATS["tokens_in"] += raw_tokens
+
+    if raw_tokens <= budget:
+        PROMPT_STATS["tokens_out"] += raw_tokens
+        return raw_text, []
+
+    chunks = split_chunks(sections)
+    scores = score_many("\n".join(chunk["lines"]) for chunk in chunks)
+
+    # Keyword density: a long chunk with one "job" in it is worth
+    # less than a short one
+    for chunk, score in zip(chunks, scores):
+        chunk["score"] = float(score) * CHUNK_TOKENS / max(chunk["tokens"], CHUNK_TOKENS)
+
+    # Lowest drop rank, lowest density, latest position first
+    candidates = sorted(
+        (index for index, chunk in enumerate(chunks) if not chunk["protected"]),
+        key=lambda index: (DROP_ORDER[chunks[index]["kind"]], chunks[index]["score"], -index)
+    )
+
+    def dropped(index: int, section: int) -> bool:
+        return (
+            0 <= index < len(chunks)
+            and chunks[index]["section"] == section
+            and index not in kept
+        )
+
+    kept = set(range(len(chunks)))
+    total = sum(chunk["tokens"] for chunk in chunks) + sum(
+        estimate_tokens(SECTION_LABELS[kind]) for kind, text in sections if text
+    )
+    cuts = []
+
+    for index in candidates:
+        if total <= budget:
+            break
+        kept.discard(index)
+        total -= chunks[index]["tokens"]
+
+        # One TRIM_MARKER per run of dropped chunks: a new run
+        # adds one, joining two runs removes one
+        section = chunks[index]["section"]
+        runs_joined = dropped(index - 1, section) + dropped(index + 1, section)
+        total += (1 - runs_joined) * TRIM_MARKER_TOKENS
+        cuts.append({
+            "kind": chunks[index]["kind"],
+            "tokens": chunks[index]["tokens"],
+            "score": round(chunks[index]["score"], 3)
+        })
+
+    prompt_text = _render_kept(sections, chunks, kept)
+
+    # Protected chunks alone can still be over budget (one huge
+    # line): hard cut at the budget
+    max_chars = budget * CHARS_PER_TOKEN
+    if len(prompt_text) > max_chars:
+        cuts.append({
+            "kind": "truncated",
+            "tokens": estimate_tokens(prompt_text[max_chars:]),
+            "score": None
+        })
+        prompt_text = prompt_text[:max_chars].rstrip() + "\n" + TRIM_MARKER
+
+    PROMPT_STATS["trimmed"] += 1
+    PROMPT_STATS["tokens_out"] += estimate_tokens(prompt_text)
+    for cut in cuts:
+        PROMPT_STATS[f"cut_{cut['kind']}_tokens"] += cut["tokens"]
+
+    return prompt_text, cuts
+
+
+def describe_cuts(cuts: list[dict]) -> str:
+    by_kind = Counter()
+    for cut in cuts:
+        by_kind[cut["kind"]] += cut["tokens"]
+    return ", ".join(f"{kind} {tokens}" for kind, tokens in by_kind.items())
+
+
+def prompt_summary() -> str:
+    tokens_in = PROMPT_STATS["tokens_in"]
+    saved = tokens_in - PROMPT_STATS["tokens_out"]
+    cut_tokens = " ".join(
+        f"{kind}={PROMPT_STATS[f'cut_{kind}_tokens']}"
+        for kind in ("footer", "ocr", "body", "truncated")
+        if PROMPT_STATS[f"cut_{kind}_tokens"]
+    )
+    return (
+        f"emails={PROMPT_STATS['emails']} trimmed={PROMPT_STATS['trimmed']} "
+        f"tokens saved≈{saved} ({saved / max(1, tokens_in):.0%})"
+        + (f" | cut {cut_tokens}" if cut_tokens else "")
+    )
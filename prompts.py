@@ -146,4 +146,21 @@ CRITICAL RULES (ABSOLUTE):
 
 --------------------------------------------------
 END OF INSTRUCTIONS.
-"""
\ No newline at end of file
+"""
+
+BATCH_ANALYSIS_PROMPT = """
+--------------------------------------------------
+BATCH MODE (OVERRIDES THE SINGLE-EMAIL OUTPUT SHAPE):
+
+You will receive SEVERAL emails. Each one starts with a line
+=== EMAIL <message_id> ===
+
+- Apply ALL rules above to EACH email independently.
+- NEVER mix information between emails.
+- Output ONE JSON array with exactly one object per email,
+  in the same order.
+- Each object MUST follow the output format for its email_type
+  AND have one extra top-level field:
+  "message_id": copied EXACTLY from the email's header line.
+- Output MUST be the JSON array ONLY.
+"""
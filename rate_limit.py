@@ -0,0 +1,72 @@
+# rate_limit.py
+
+import random
+import threading
+import time
+
+
+# =========================================================
+# 🪣 ADAPTIVE TOKEN BUCKET
+# =========================================================
+
+class TokenBucket:
+    """
+    Thread-safe token bucket.
+
+    - `rate` tokens are added per second, up to `capacity`
+    - acquire(n) blocks until n tokens are available
+    - on_throttle() halves the refill rate (down to min_rate);
+      on_success() grows it back towards the configured rate
+    """
+
+    def __init__(self, rate: float, capacity: float, min_rate: float = None):
+        self.max_rate = rate
+        self.rate = rate
+        self.min_rate = min_rate or rate / 16
+        self.capacity = capacity
+
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(
+            self.capacity,
+            self._tokens + (now - self._updated) * self.rate
+        )
+        self._updated = now
+
+    def acquire(self, amount: float = 1) -> None:
+        # Requests larger than the bucket would never fit
+        amount = min(amount, self.capacity)
+
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return
+                wait = (amount - self._tokens) / self.rate
+
+            time.sleep(wait)
+
+    def on_throttle(self) -> None:
+        with self._lock:
+            self._refill()
+            self.rate = max(self.min_rate, self.rate / 2)
+
+    def on_success(self) -> None:
+        if self.rate >= self.max_rate:
+            return
+        with self._lock:
+            self._refill()
+            self.rate = min(self.max_rate, self.rate * 1.05)
+
+
+# =========================================================
+# ⏳ EXPONENTIAL BACKOFF (FULL JITTER)
+# =========================================================
+
+def backoff_delay(attempt: int, base: float = 1.0, cap: float = 60.0) -> float:
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
@@ -0,0 +1,344 @@
+# replay.py
+
+import hashlib
+import json
+import os
+import random
+import time
+
+from googleapiclient.errors import HttpError
+
+
+# =========================================================
+# ⚙️ RECORD / REPLAY SETTINGS
+# EMAIL_AGENT_REPLAY=record  → call the real APIs and save every
+#                              response under FIXTURES_DIR
+# EMAIL_AGENT_REPLAY=replay  → serve Gmail + Gemini from those
+#                              fixtures (no network, no keys)
+# =========================================================
+
+REPLAY_MODE = os.getenv("EMAIL_AGENT_REPLAY", "").lower()
+FIXTURES_DIR = os.getenv("EMAIL_AGENT_FIXTURES_DIR", "fixtures")
+
+# Injected per-round-trip latency in replay mode
+GMAIL_LATENCY_MS = float(os.getenv("EMAIL_AGENT_GMAIL_LATENCY_MS", "0"))
+LLM_LATENCY_MS = float(os.getenv("EMAIL_AGENT_LLM_LATENCY_MS", "0"))
+
+# Share of replayed Gmail calls failed with a throttling /
+# server error (FaultInjector), to exercise retry and backoff
+GMAIL_FAULT_RATE = float(os.getenv("EMAIL_AGENT_GMAIL_FAULT_RATE", "0"))
+
+# Gmail discovery methods that build a request (everything else
+# returns a sub-resource, e.g. users(), messages())
+REQUEST_METHODS = {"get", "list", "getProfile"}
+
+
+class ReplayMiss(LookupError):
+    pass
+
+
+class RecordedError(Exception):
+    """A recorded Gemini error, raised again on replay."""
+
+    def __init__(self, code: int, message: str):
+        super().__init__(message)
+        self.code = code
+
+
+# =========================================================
+# 🗂️ FIXTURE STORE
+# =========================================================
+
+class FixtureStore:
+    """
+    One JSON file per call, named by the hash of the call:
+        <root>/<kind>/<sha256>.json
+
+    A call that failed is stored as {"call", "error": {"status",
+    "body"}} and raised again by load (HttpError for gmail,
+    RecordedError for llm).
+    """
+
+    def __init__(self, root: str = FIXTURES_DIR):
+        self.root = root
+
+    def _path(self, kind: str, call: dict) -> str:
+        digest = hashlib.sha256(
+            json.dumps(call, sort_keys=True).encode("utf-8")
+        ).hexdigest()
+        return os.path.join(self.root, kind, f"{digest}.json")
+
+    def save(self, kind: str, call: dict, response) -> None:
+        path = self._path(kind, call)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"call": call, "response": response}, f)
+
+    def save_error(self, kind: str, call: dict, status: int, body: dict) -> None:
+        path = self._path(kind, call)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"call": call, "error": {"status": status, "body": body}}, f)
+
+    def load(self, kind: str, call: dict):
+        path = self._path(kind, call)
+
+        if not os.path.exists(path):
+            raise ReplayMiss(f"No {kind} fixture for {call}")
+
+        with open(path, encoding="utf-8") as f:
+            fixture = json.load(f)
+
+        error = fixture.get("error")
+        if error is None:
+            return fixture["response"]
+
+        if kind == "gmail":
+            raise http_error(error["status"], error["body"])
+        raise RecordedError(error["status"], error["body"].get("message", ""))
+
+
+def _sleep_ms(ms: float) -> None:
+    if ms > 0:
+        time.sleep(ms / 1000)
+
+
+# =========================================================
+# 💥 GMAIL ERROR INJECTION
+# =========================================================
+
+# status → error body as Gmail sends it
+FAULT_BODIES = {
+    429: {"code": 429, "message": "Too many concurrent requests for user",
+          "errors": [{"reason": "rateLimitExceeded"}]},
+    403: {"code": 403, "message": "User-rate limit exceeded",
+          "errors": [{"reason": "rateLimitExceeded"}]},
+    500: {"code": 500, "message": "Backend Error",
+          "errors": [{"reason": "backendError"}]},
+    503: {"code": 503, "message": "The service is currently unavailable.",
+          "errors": [{"reason": "backendError"}]},
+}
+
+
+class _ErrorResponse(dict):
+    """The parts of httplib2.Response that HttpError reads."""
+
+    def __init__(self, status: int, reason: str = ""):
+        super().__init__(status=str(status))
+        self.status = status
+        self.reason = reason
+
+
+def error_body(error: HttpError) -> dict:
+    """The {"code", "message", ...} part of a Gmail error."""
+    try:
+        return json.loads(error.content)["error"]
+    except (ValueError, KeyError, TypeError):
+        return {"code": error.resp.status, "message": str(error)}
+
+
+def http_error(status: int, body: dict = None) -> HttpError:
+    body = body or FAULT_BODIES.get(status, {"code": status, "message": ""})
+    return HttpError(
+        _ErrorResponse(status, body.get("message", "")),
+        json.dumps({"error": body}).encode("utf-8")
+    )
+
+
+class FaultInjector:
+    """
+    Decides which stand-in calls fail: the statuses in `schedule`
+    first (None = succeed), then each call fails with probability
+    `rate`, with a status drawn from `statuses`.
+    """
+
+    def __init__(self, rate: float = 0.0, statuses=(429, 403, 503), schedule=(), seed: int = 6):
+        self.rate = rate
+        self.statuses = list(statuses)
+        self._schedule = list(schedule)
+        self._random = random.Random(seed)
+        self.injected = 0
+
+    def next_fault(self) -> HttpError | None:
+        if self._schedule:
+            status = self._schedule.pop(0)
+        elif self.rate and self._random.random() < self.rate:
+            status = self._random.choice(self.statuses)
+        else:
+            status = None
+
+        if status is None:
+            return None
+        self.injected += 1
+        return http_error(status)
+
+
+# =========================================================
+# 📧 GMAIL STAND-IN
+# =========================================================
+
+class _Request:
+    """Mimics googleapiclient's HttpRequest (execute only)."""
+
+    def __init__(self, service, call: dict, real_request=None):
+        self._service = service
+        self._call = call
+        self._real = real_request
+
+    def _load(self):
+        return self._service.store.load("gmail", self._call)
+
+    def execute(self):
+        if self._real is None:
+            _sleep_ms(self._service.latency_ms)
+            self._service.inject_fault()
+            return self._load()
+
+        try:
+            response = self._real.execute()
+        except HttpError as e:
+            # 404 / 429 / ... replay as the same error
+            self._service.store.save_error(
+                "gmail", self._call, e.resp.status, error_body(e)
+            )
+            raise
+
+        self._service.store.save("gmail", self._call, response)
+        return response
+
+
+class _Batch:
+    """Mimics BatchHttpRequest: one round trip for all calls."""
+
+    def __init__(self, service, callback, real_batch=None):
+        self._service = service
+        self._callback = callback
+        self._real = real_batch
+        self._requests = []
+
+    def add(self, request, callback=None, request_id=None):
+        callback = callback or self._callback
+
+        if self._real is None:
+            self._requests.append((request, callback, request_id))
+            return
+
+        def record(rid, response, exception):
+            if exception is None:
+                self._service.store.save("gmail", request._call, response)
+            elif isinstance(exception, HttpError):
+                self._service.store.save_error(
+                    "gmail", request._call, exception.resp.status, error_body(exception)
+                )
+            if callback:
+                callback(rid, response, exception)
+
+        self._real.add(request._real, callback=record, request_id=request_id)
+
+    def execute(self):
+        if self._real is not None:
+            return self._real.execute()
+
+        _sleep_ms(self._service.latency_ms)
+
+        # The whole batch POST can fail, or single calls inside it
+        self._service.inject_fault()
+
+        for request, callback, request_id in self._requests:
+            try:
+                self._service.inject_fault()
+                response, exception = request._load(), None
+            except (ReplayMiss, HttpError) as e:
+                response, exception = None, e
+
+            if callback:
+                callback(request_id, response, exception)
+
+
+class _Resource:
+    def __init__(self, service, path: str, real=None):
+        self._service = service
+        self._path = path
+        self._real = real
+
+    def __getattr__(self, name):
+        path = f"{self._path}.{name}" if self._path else name
+        real_method = getattr(self._real, name) if self._real else None
+
+        def method(*args, **kwargs):
+            real = real_method(*args, **kwargs) if real_method else None
+
+            if name in REQUEST_METHODS:
+                call = {"method": path, "kwargs": kwargs}
+                return _Request(self._service, call, real)
+
+            return _Resource(self._service, path, real)
+
+        return method
+
+
+class GmailStandIn(_Resource):
+    """
+    Drop-in for the Gmail discovery service.
+
+    With real_service=None every call is served from fixtures
+    (replay); otherwise calls go to real_service and responses
+    are written to fixtures (record). In replay, `faults` (a
+    FaultInjector) fails calls with 429 / 403 rateLimitExceeded
+    / 5xx before they are served.
+    """
+
+    def __init__(
+        self,
+        store: FixtureStore = None,
+        real_service=None,
+        latency_ms: float = GMAIL_LATENCY_MS,
+        faults: FaultInjector = None
+    ):
+        self.store = store or FixtureStore()
+        self.latency_ms = latency_ms
+        self.faults = faults
+        if faults is None and GMAIL_FAULT_RATE:
+            self.faults = FaultInjector(rate=GMAIL_FAULT_RATE)
+        super().__init__(self, "", real_service)
+
+    def inject_fault(self) -> None:
+        if self.faults is not None:
+            error = self.faults.next_fault()
+            if error is not None:
+                raise error
+
+    def new_batch_http_request(self, callback=None):
+        real_batch = None
+        if self._real is not None:
+            real_batch = self._real.new_batch_http_request()
+        return _Batch(self, callback, real_batch)
+
+
+# =========================================================
+# 🧠 GEMINI STAND-IN
+# =========================================================
+
+def _llm_call(model: str, prompt: str) -> dict:
+    return {
+        "model": model,
+        "prompt_sha256": hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+    }
+
+
+def record_llm(model: str, prompt: str, text: str) -> None:
+    FixtureStore().save("llm", _llm_call(model, prompt), text)
+
+
+def record_llm_error(model: str, prompt: str, error: Exception) -> None:
+    FixtureStore().save_error(
+        "llm", _llm_call(model, prompt),
+        getattr(error, "code", None), {"message": str(error)}
+    )
+
+
+def replay_llm(model: str, prompt: str) -> str:
+    _sleep_ms(LLM_LATENCY_MS)
+    return FixtureStore().load("llm", _llm_call(model, prompt))
@@ -2,6 +2,7 @@ import json
 from datetime import datetime
 
 from Connection import get_gmail_service
+from gmail_fetch import iter_with_metadata, iter_messages_oldest_first
 from inbox import get_clean_email_text
 from db_Persistor import persist_email_payload, email_already_processed
 from db_Connection import get_db_connection
@@ -50,49 +51,24 @@ def main():
     service = get_gmail_service()
     print("✅ Gmail service created\n")
 
-    query = f"in:inbox after:{START_DATE} before:{END_DATE}"
-
     # --------------------------------------------------
-    # 📩 PAGINATED GMAIL FETCH (CRITICAL FIX)
+    # 📩 STREAMING GMAIL LISTING (OLDEST FIRST)
     # --------------------------------------------------
-    messages = []
-    page_token = None
-
-    while True:
-        resp = service.users().messages().list(
-            userId="me",
-            q=query,
-            maxResults=MAX_EMAILS,
-            pageToken=page_token
-        ).execute()
-
-        messages.extend(resp.get("messages", []))
-        page_token = resp.get("nextPageToken")
-
-        if not page_token:
-            break
-
-    messages = list(reversed(messages))
-    print(f"📩 Total fetched: {len(messages)} emails\n")
+    messages = iter_messages_oldest_first(
+        service, START_DATE, END_DATE, page_size=MAX_EMAILS
+    )
 
     llm_count = 0
 
     # --------------------------------------------------
     # 🔁 PROCESS EMAILS
     # --------------------------------------------------
-    for idx, msg in enumerate(messages, start=1):
+    # 1️⃣ METADATA FETCH (cheap, batched)
+    for idx, (msg, full) in enumerate(
+        iter_with_metadata(service, messages, ["From", "Subject"]), start=1
+    ):
         message_id = msg["id"]
 
-        # --------------------------------------------------
-        # 1️⃣ METADATA FETCH (cheap)
-        # --------------------------------------------------
-        full = service.users().messages().get(
-            userId="me",
-            id=message_id,
-            format="metadata",
-            metadataHeaders=["From", "Subject"]
-        ).execute()
-
         label_ids = full.get("labelIds", [])
         headers = full.get("payload", {}).get("headers", [])
         subject = get_header(headers, "Subject")
@@ -130,7 +106,7 @@ def main():
         # --------------------------------------------------
         # 4️⃣ FULL EMAIL EXTRACTION
         # --------------------------------------------------
-        email_data = get_clean_email_text(message_id)
+        email_data = get_clean_email_text(message_id, service)
 
         print("\n📨 CLEANED EMAIL TEXT (COPY THIS TO GEMINI)")
         print("-" * 100)
@@ -0,0 +1,112 @@
+# thread_context.py
+
+import re
+from collections import Counter
+
+
+# =========================================================
+# ⚙️ QUOTED-REPLY DETECTION
+# Every reply in a recruiting thread carries the full quoted
+# history. Only the new turn is sent to the LLM; what earlier
+# turns established comes from the opportunities table.
+# =========================================================
+
+# Everything from the first match on is quoted history.
+# HTML quotes render the attribution over several lines
+# ("On … <", "jane@x.com", "> wrote:"), hence the line budget.
+QUOTE_START_REGEXES = [
+    # Gmail / Apple Mail: "On Mon, 2 Feb 2026 … Jane <…> wrote:"
+    re.compile(r"^On\b[^\n]{0,200}?(?:\n[^\n]{0,200}?){0,3}\bwrote:[ \t]*$", re.M),
+    # Outlook
+    re.compile(r"^-{2,}\s*Original Message\s*-{2,}", re.M | re.I),
+    re.compile(r"^From:[^\n]*\n(?:[^\n]*\n){0,2}?(?:Sent|Date):", re.M),
+]
+
+# Everything from the first match on is a signature
+SIGNATURE_START_REGEXES = [
+    re.compile(r"^--[ \t]*$", re.M),
+    re.compile(r"^Sent from my \w+", re.M | re.I),
+]
+
+QUOTED_LINE_REGEX = re.compile(r"^[ \t]*>[^\n]*\n?", re.M)
+
+# thread_lookups / first_messages / stripped_chars / prior_states
+THREAD_STATS = Counter()
+
+
+def _cut_at_first(text: str, regexes) -> str:
+    positions = [
+        match.start()
+        for match in (regex.search(text) for regex in regexes)
+        if match
+    ]
+    return text[:min(positions)] if positions else text
+
+
+def strip_quoted_reply(text: str) -> str:
+    """
+    Returns only the new turn of a reply: quoted history ("On …
+    wrote:", Outlook headers, "> " lines) and the signature are
+    removed. Falls back to the full text if nothing would remain.
+    """
+    if not text:
+        return ""
+
+    new_turn = _cut_at_first(text, QUOTE_START_REGEXES)
+    new_turn = QUOTED_LINE_REGEX.sub("", new_turn)
+    new_turn = _cut_at_first(new_turn, SIGNATURE_START_REGEXES)
+
+    if not new_turn.strip():
+        return text
+
+    THREAD_STATS["stripped_chars"] += len(text) - len(new_turn)
+    return new_turn
+
+
+# =========================================================
+# 🧾 PRIOR STATE SUMMARY
+# =========================================================
+
+def summarize_prior_state(opportunities: list[dict]) -> str:
+    """
+    One compact line per opportunity already extracted from
+    earlier messages of the thread.
+    """
+    if not opportunities:
+        return ""
+
+    lines = []
+    for opp in opportunities:
+        fields = [
+            opp.get("company") or "?",
+            opp.get("role") or "?",
+            opp.get("pipeline_stage") or "?"
+        ]
+        if opp.get("action_required"):
+            fields.append("action required")
+        if opp.get("deadline"):
+            fields.append(f"deadline {opp['deadline']}")
+        if opp.get("event_date"):
+            fields.append(f"event {opp['event_date']}")
+        lines.append("- " + " | ".join(str(field) for field in fields))
+
+    THREAD_STATS["prior_states"] += 1
+    return "\n".join(lines)
+
+
+def with_prior_state(raw_text: str, prior_state: str) -> str:
+    if not prior_state:
+        return raw_text
+    return (
+        "--- PRIOR THREAD STATE (already recorded) ---\n\n"
+        + prior_state + "\n\n" + raw_text
+    )
+
+
+def thread_summary() -> str:
+    return (
+        f"thread lookups={THREAD_STATS['thread_lookups']} "
+        f"first messages={THREAD_STATS['first_messages']} "
+        f"prior states attached={THREAD_STATS['prior_states']} "
+        f"quoted chars stripped={THREAD_STATS['stripped_chars']}"
+    )